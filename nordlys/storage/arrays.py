@@ -0,0 +1,87 @@
+"""
+Tools for read-only, memory-mapped arrays used by the on-disk stores.
+
+- load_array: memory-maps a binary file written by numpy's tofile()
+- StringTable: table of strings, stored as a blob of concatenated strings and an offsets array
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import mmap
+import os
+import struct
+import numpy as np
+
+
+def load_array(file_name, dtype):
+    """Memory-maps an array from a binary file (np.memmap does not accept empty files)."""
+    if os.path.getsize(file_name) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file_name, dtype=dtype, mode="r")
+
+
+class StringTable(object):
+    """
+    Read-only table of strings (utf-8 encoded), memory-mapped from two files:
+      - blob file: concatenated strings
+      - offsets file: int64 array; the i-th string is blob[offsets[i]:offsets[i+1]]
+    If the strings are written in sorted order, they can be searched using find().
+    """
+
+    def __init__(self, blob_file, offsets_file):
+        self.offsets = load_array(offsets_file, np.int64)
+        self.blob = ""
+        if os.path.getsize(blob_file) > 0:
+            with open(blob_file, "rb") as f:
+                self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    @staticmethod
+    def encode(s):
+        return s.encode("utf-8") if isinstance(s, unicode) else s
+
+    def bisect_left(self, s):
+        """Returns the position of the first string >= s (strings should be sorted)."""
+        s = self.encode(s)
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < s:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, s):
+        """Returns the position of the string, or None if it is not in the (sorted) table."""
+        s = self.encode(s)
+        pos = self.bisect_left(s)
+        if (pos < len(self)) and (self[pos] == s):
+            return pos
+        return None
+
+
+class StringTableWriter(object):
+    """Writes a StringTable, one string at a time."""
+
+    def __init__(self, blob_file, offsets_file):
+        self.blob = open(blob_file, "wb")
+        self.offsets = open(offsets_file, "wb")
+        self.offset = 0
+        self.offsets.write(struct.pack("<q", self.offset))
+
+    def add(self, s):
+        """Appends the string to the table."""
+        s = StringTable.encode(s)
+        self.blob.write(s)
+        self.offset += len(s)
+        self.offsets.write(struct.pack("<q", self.offset))
+
+    def close(self):
+        self.blob.close()
+        self.offsets.close()
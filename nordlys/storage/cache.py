@@ -0,0 +1,73 @@
+"""
+Bounded in-memory cache with least-recently-used (LRU) eviction.
+
+The cache can be saved to disk and loaded again, e.g., to warm-start the next run.
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import cPickle
+import os
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Key-value cache holding at most max_size items; the least recently used items are evicted first."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.__items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, key):
+        return key in self.__items
+
+    def get(self, key, default=None):
+        """Returns the cached value of the key (and marks it as recently used) or the default value."""
+        try:
+            value = self.__items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.__items[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Adds the key-value pair to the cache and evicts the least recently used items if needed."""
+        if key in self.__items:
+            del self.__items[key]
+        self.__items[key] = value
+        while len(self.__items) > self.max_size:
+            self.__items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Removes all items (statistics are kept)."""
+        self.__items.clear()
+
+    def stats(self):
+        """Returns cache statistics: {size, hits, misses, evictions, hit_rate}."""
+        lookups = self.hits + self.misses
+        return {'size': len(self.__items), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / float(lookups) if lookups != 0 else 0}
+
+    def save(self, file_name):
+        """Writes the cached items (from least to most recently used) to a file."""
+        with open(file_name, "wb") as out:
+            cPickle.dump(self.__items.items(), out, cPickle.HIGHEST_PROTOCOL)
+        print "Cache with", len(self.__items), "items is written to", file_name
+
+    def load(self, file_name):
+        """Adds the items of a saved cache; does nothing if the file does not exist."""
+        if not os.path.exists(file_name):
+            return
+        with open(file_name, "rb") as in_file:
+            for key, value in cPickle.load(in_file):
+                self.put(key, value)
+        print "Cache with", len(self.__items), "items is loaded from", file_name
@@ -0,0 +1,190 @@
+"""
+Read-only, memory-mapped table of candidate entities with precomputed commonness.
+
+For each surface form, the table holds the candidate entities of TAGME (see Mention.get_wiki_matches), already
+filtered by the commonness threshold:
+  - anchor entities with commonness >= CMN_TH
+  - title, title-nv and redirect entities, regardless of their commonness
+Candidates are stored in the iteration order of Mention.get_men_candidate_ens, so that ties are broken the same way.
+Candidates of a surface form are then read as a slice of two arrays, and the table can be shared by many processes.
+Entities are represented by their ids in the entity id store (nordlys.storage.entity_ids), which should be built
+with the entities of the surface form store (-sfstore); the same store should be used for annotation. The size and
+checksum of the store are recorded in the table, and checked when the table is used (see check_entity_ids).
+Surface forms that are never used as anchors are not in the table.
+
+Files of the store:
+  - keys.bin, key_offsets.bin: sorted surface forms (StringTable)
+  - occurrences.bin: int64 array; number of times the i-th surface form is used as an anchor
+  - link_probs.bin: precomputed link probabilities of the keys (freq is -1 if they are not computed)
+  - offsets.bin: int64 array; candidates of the i-th key are entities[offsets[i]:offsets[i+1]]
+  - entities.bin: int32 array of entity ids
+  - commonness.bin: float64 array of commonness scores
+  - entity_ids.txt: number of ids and checksum of the entity id store (see EntityIds.fingerprint)
+
+Usage:
+  python -m nordlys.storage.candidates -sfstore path/to/sf_store -entityids path/to/entity_ids
+    -outputdir path/to/candidates
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import os
+from collections import OrderedDict
+import numpy as np
+from nordlys.storage.arrays import load_array, StringTable, StringTableWriter
+from nordlys.storage.entity_ids import EntityIds
+from nordlys.storage.sf_store import SurfaceFormStore
+
+
+class CandidateTable(object):
+    KEYS_FILE = "keys.bin"
+    KEY_OFFSETS_FILE = "key_offsets.bin"
+    OCCURRENCES_FILE = "occurrences.bin"
+    LINK_PROBS_FILE = "link_probs.bin"
+    OFFSETS_FILE = "offsets.bin"
+    ENTITIES_FILE = "entities.bin"
+    COMMONNESS_FILE = "commonness.bin"
+    ENTITY_IDS_FILE = "entity_ids.txt"
+
+    CMN_TH = 0.001  # commonness threshold of the candidates (same as Tagme.parse)
+    # facc is NaN if there is no facc link probability
+    LINK_PROB_DTYPE = SurfaceFormStore.LINK_PROB_DTYPE
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.keys = StringTable(self.__path(self.KEYS_FILE), self.__path(self.KEY_OFFSETS_FILE))
+        self.occurrences = load_array(self.__path(self.OCCURRENCES_FILE), np.int64)
+        self.link_probs = load_array(self.__path(self.LINK_PROBS_FILE), self.LINK_PROB_DTYPE)
+        self.offsets = load_array(self.__path(self.OFFSETS_FILE), np.int64)
+        self.entities = load_array(self.__path(self.ENTITIES_FILE), np.int32)
+        self.commonness = load_array(self.__path(self.COMMONNESS_FILE), np.float64)
+        print "Connected to candidate table " + store_dir
+
+    def __path(self, file_name):
+        return os.path.join(self.store_dir, file_name)
+
+    def find(self, surface_form):
+        """Returns position of the surface form in the table, or None if it is not in the table."""
+        return self.keys.find(surface_form)
+
+    def get_occurrences(self, pos):
+        """Returns number of times the surface form is used as an anchor."""
+        return int(self.occurrences[pos])
+
+    def get_link_probs(self, pos):
+        """Returns precomputed link probabilities {"freq": n, "wiki": lp, ...}; empty if they are not computed."""
+        freq, wiki_lp, facc_lp = self.link_probs[pos].tolist()
+        if freq == -1:
+            return {}
+        link_probs = {"freq": freq, "wiki": wiki_lp}
+        if not np.isnan(facc_lp):
+            link_probs["facc"] = facc_lp
+        return link_probs
+
+    def get_candidates(self, pos):
+        """Returns candidate entities of the surface form, in the stored order: {en_id: commonness, ...}"""
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        return OrderedDict(zip(self.entities[start:end].tolist(), self.commonness[start:end].tolist()))
+
+    def check_entity_ids(self, entity_ids):
+        """Raises an exception if the entity id store (EntityIds object) is not the one the table is built with."""
+        file_name = self.__path(self.ENTITY_IDS_FILE)
+        if not os.path.exists(file_name):
+            raise Exception("Candidate table " + self.store_dir + " has no record of its entity id store; rebuild it")
+        with open(file_name, "r") as f:
+            size, checksum = f.read().strip().split("\t")
+        if [size, checksum] != [str(v) for v in entity_ids.fingerprint()]:
+            raise Exception("Candidate table " + self.store_dir + " is built with a different entity id store; "
+                            "rebuild it or set the entity id store it is built with")
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def get_doc_candidates(doc):
+        """
+        Computes candidate entities of a surface form document (same as Mention.get_wiki_matches).
+
+        :param doc: {source: {en: count, ...}, ...}
+        :return: number of anchor occurrences, and candidates {en_uri: commonness, ...}
+        """
+        anchors = doc.get("anchor", {})
+        occurrences = sum(anchors.itervalues())
+        candidates = {}
+        for en, count in anchors.iteritems():
+            cmn = count / float(occurrences)
+            if cmn >= CandidateTable.CMN_TH:
+                candidates[en] = cmn
+        for source in ["title", "title-nv", "redirect"]:
+            for en in doc.get(source, {}):
+                if en not in candidates:
+                    candidates[en] = anchors.get(en, 0) / float(occurrences)
+        return occurrences, candidates
+
+    @staticmethod
+    def build(sf_store_dir, entity_ids_dir, store_dir):
+        """
+        Builds the table from the surface form store.
+
+        :param sf_store_dir: surface form store
+        :param entity_ids_dir: entity id store (with the entities of the surface form store)
+        :param store_dir: output directory
+        """
+        sf_store = SurfaceFormStore(sf_store_dir)
+        entity_ids = EntityIds(entity_ids_dir)
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        path = lambda file_name: os.path.join(store_dir, file_name)
+
+        keys = StringTableWriter(path(CandidateTable.KEYS_FILE), path(CandidateTable.KEY_OFFSETS_FILE))
+        entities = open(path(CandidateTable.ENTITIES_FILE), "wb")
+        commonness = open(path(CandidateTable.COMMONNESS_FILE), "wb")
+        occurrences, link_probs, offsets = [], [], [0]
+        for pos in xrange(len(sf_store)):
+            doc = sf_store.get_doc(pos)
+            occ, wiki_matches = CandidateTable.get_doc_candidates(doc) if "anchor" in doc else (0, {})
+            if occ == 0:
+                continue
+            # same as Mention.get_men_candidate_ens
+            cand_ens = {}
+            cand_ens.update(wiki_matches)
+            candidates = [(entity_ids.get_id(en), cmn) for en, cmn in cand_ens.iteritems()]
+            keys.add(sf_store.keys[pos])
+            occurrences.append(occ)
+            sf_link_probs = doc.get(SurfaceFormStore.LINK_PROB_FIELD)
+            if sf_link_probs is None:
+                link_probs.append((-1, 0, np.nan))
+            else:
+                link_probs.append((sf_link_probs["freq"], sf_link_probs["wiki"], sf_link_probs.get("facc", np.nan)))
+            np.array([en_id for en_id, _ in candidates], dtype=np.int32).tofile(entities)
+            np.array([cmn for _, cmn in candidates], dtype=np.float64).tofile(commonness)
+            offsets.append(offsets[-1] + len(candidates))
+            if len(occurrences) % 1000000 == 0:
+                print "Processed", len(occurrences), "th surface form!"
+        if len(entity_ids.overflow_uris) > 0:
+            raise Exception(str(len(entity_ids.overflow_uris)) + " entities are not in the entity id store; "
+                            "build it with the entities of the surface form store (-sfstore)")
+
+        keys.close()
+        entities.close()
+        commonness.close()
+        np.array(occurrences, dtype=np.int64).tofile(path(CandidateTable.OCCURRENCES_FILE))
+        np.array(link_probs, dtype=CandidateTable.LINK_PROB_DTYPE).tofile(path(CandidateTable.LINK_PROBS_FILE))
+        np.array(offsets, dtype=np.int64).tofile(path(CandidateTable.OFFSETS_FILE))
+        with open(path(CandidateTable.ENTITY_IDS_FILE), "w") as f:
+            f.write("\t".join(str(v) for v in entity_ids.fingerprint()) + "\n")
+        print "Candidates of", len(occurrences), "surface forms are written to", store_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-sfstore", help="Path to surface form store")
+    parser.add_argument("-entityids", help="Path to entity id store")
+    parser.add_argument("-outputdir", help="Path to write the candidate table")
+    args = parser.parse_args()
+
+    CandidateTable.build(args.sfstore, args.entityids, args.outputdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Bidirectional dictionary of entity URIs and integer ids.
+
+Entity ids are positions of the URIs in a sorted, memory-mapped string table built from page-id-titles.txt;
+hence, ids of the same store are the same across processes and runs. URIs that are not in the table (e.g., links
+to missing pages) get overflow ids (after the ids of the table) on first use; overflow ids can be saved and loaded
+together with data keyed by entity ids (e.g., caches). Without a store, all ids are overflow ids.
+
+Files of the store:
+  - uris.bin, uri_offsets.bin: sorted entity URIs (StringTable)
+
+The store can also include the entities of a surface form store (-sfstore), so that all candidate entities
+have ids in the store (required by nordlys.storage.candidates).
+
+Usage:
+  python -m nordlys.storage.entity_ids -titles path/to/page-id-titles.txt [-sfstore path/to/sf_store]
+    -outputdir path/to/entity_ids
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import cPickle
+import os
+from hashlib import md5
+from urllib import unquote
+from nordlys.storage.arrays import StringTable, StringTableWriter
+from nordlys.wikipedia.utils import WikipediaUtils
+
+
+class EntityIds(object):
+    URIS_FILE = "uris.bin"
+    URI_OFFSETS_FILE = "uri_offsets.bin"
+    CHECKSUM_BLOCK_SIZE = 1 << 24
+
+    def __init__(self, store_dir=None):
+        """
+        :param store_dir: entity id store; if None, ids are assigned on first use
+        """
+        self.uris = []
+        if store_dir:
+            self.uris = StringTable(os.path.join(store_dir, self.URIS_FILE),
+                                    os.path.join(store_dir, self.URI_OFFSETS_FILE))
+            print "Connected to entity id store " + store_dir
+        self.overflow_ids = {}  # {uri: id, ...} for URIs that are not in the store
+        self.overflow_uris = []
+
+    def get_id(self, uri):
+        """Returns id of the entity URI."""
+        en_id = self.overflow_ids.get(uri)
+        if en_id is not None:
+            return en_id
+        en_id = self.uris.find(uri) if len(self.uris) > 0 else None
+        if en_id is None:
+            en_id = len(self.uris) + len(self.overflow_uris)
+            self.overflow_ids[uri] = en_id
+            self.overflow_uris.append(uri)
+        return en_id
+
+    def get_uri(self, en_id):
+        """Returns URI of the entity id."""
+        if en_id < len(self.uris):
+            return self.uris[en_id]
+        return self.overflow_uris[en_id - len(self.uris)]
+
+    def __len__(self):
+        return len(self.uris) + len(self.overflow_uris)
+
+    def fingerprint(self):
+        """
+        Returns (number of ids, md5 checksum of the URIs) of the store; data keyed by entity ids (e.g., the candidate
+        table) records it, so that it is only used with the same store.
+        """
+        if len(self.uris) == 0:
+            return 0, None
+        checksum = md5()
+        for start in xrange(0, len(self.uris.blob), self.CHECKSUM_BLOCK_SIZE):
+            checksum.update(self.uris.blob[start:start + self.CHECKSUM_BLOCK_SIZE])
+        return len(self.uris), checksum.hexdigest()
+
+    def save_overflow(self, file_name):
+        """Saves the overflow ids."""
+        with open(file_name, "wb") as f:
+            cPickle.dump(self.overflow_uris, f, cPickle.HIGHEST_PROTOCOL)
+
+    def load_overflow(self, file_name):
+        """Loads the overflow ids; should be done before any overflow id is assigned."""
+        if len(self.overflow_uris) > 0:
+            raise Exception("Overflow ids are already assigned")
+        with open(file_name, "rb") as f:
+            for uri in cPickle.load(f):
+                self.get_id(uri)
+
+    @staticmethod
+    def build(page_ids_file, store_dir, sf_store_dir=None):
+        """
+        Builds the store from page ids and titles (URIs are the same as the ones of merge_sf).
+
+        :param page_ids_file: page-id-titles file
+        :param store_dir: output directory
+        :param sf_store_dir: if given, entities of the surface form store are added
+        """
+        uris = set()
+        with open(page_ids_file, "r") as page_ids:
+            for line in page_ids:
+                cols = line.strip().split("\t")
+                uri = WikipediaUtils.wiki_title_to_uri(unquote(cols[1].strip()))
+                if uri is not None:
+                    uris.add(StringTable.encode(uri))
+        if sf_store_dir:
+            from nordlys.storage.sf_store import SurfaceFormStore
+            sf_store = SurfaceFormStore(sf_store_dir)
+            for i in xrange(len(sf_store.entities)):
+                uris.add(sf_store.entities[i])
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        writer = StringTableWriter(os.path.join(store_dir, EntityIds.URIS_FILE),
+                                   os.path.join(store_dir, EntityIds.URI_OFFSETS_FILE))
+        for uri in sorted(uris):
+            writer.add(uri)
+        writer.close()
+        print len(uris), "entity ids are written to " + store_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-titles", help="Path to page-id-titles file")
+    parser.add_argument("-sfstore", help="Path to surface form store (optional)")
+    parser.add_argument("-outputdir", help="Path to write the entity id store")
+    args = parser.parse_args()
+
+    EntityIds.build(args.titles, args.outputdir, args.sfstore)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Precomputed in-link postings for computing Milne & Witten relatedness.
+
+The store is built offline from the annotation-only index (nordlys.wikipedia.indexer -annot).
+For each entity, it holds the sorted Lucene document ids of the articles linking to it. In-link counts of an
+entity (or of a set of entities) are then computed by intersecting sorted integer arrays in memory.
+
+Files of the store:
+  - entities.txt: entity URIs, one per line; the line number is the entity position
+  - offsets.bin:  int64 array; postings of the i-th entity are postings[offsets[i]:offsets[i+1]]
+  - postings.bin: int32 array of the concatenated (sorted) posting lists
+  - num_docs.txt: number of documents in the annotation index
+
+Usage:
+  python -m nordlys.storage.inlinks -index path/to/YYYYMMDD-index-annot -outputdir path/to/YYYYMMDD-inlinks
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import os
+from array import array
+import numpy as np
+from nordlys.storage.arrays import load_array
+
+
+class InLinks(object):
+    ENTITIES_FILE = "entities.txt"
+    OFFSETS_FILE = "offsets.bin"
+    POSTINGS_FILE = "postings.bin"
+    NUM_DOCS_FILE = "num_docs.txt"
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.offsets = load_array(os.path.join(store_dir, self.OFFSETS_FILE), np.int64)
+        self.postings = load_array(os.path.join(store_dir, self.POSTINGS_FILE), np.int32)
+        self.entity_pos = {}
+        with open(os.path.join(store_dir, self.ENTITIES_FILE), "r") as entities:
+            for pos, line in enumerate(entities):
+                self.entity_pos[line.rstrip("\n")] = pos
+        with open(os.path.join(store_dir, self.NUM_DOCS_FILE), "r") as num_docs:
+            self.__num_docs = int(num_docs.read().strip())
+        print "Connected to in-link store " + store_dir
+
+    def num_docs(self):
+        """Returns number of documents in the annotation index."""
+        return self.__num_docs
+
+    def get_postings(self, en_uri):
+        """Returns sorted array of document ids linking to the entity."""
+        pos = self.entity_pos.get(en_uri, None)
+        if pos is None:
+            return self.postings[0:0]
+        return self.postings[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def count(self, en_uris):
+        """
+        Returns "and" occurrences of entities, i.e., number of documents linking to all the given entities.
+
+        :param en_uris: list of Wikipedia uris
+        """
+        postings = sorted([self.get_postings(en_uri) for en_uri in set(en_uris)], key=len)
+        if len(postings) == 0:
+            return 0
+        common = postings[0]
+        for p in postings[1:]:
+            if len(common) == 0:
+                break
+            common = np.intersect1d(common, p, assume_unique=True)
+        return len(common)
+
+    @staticmethod
+    def build(index_dir, store_dir):
+        """
+        Builds the in-link store from the annotation-only index.
+        Terms of the contents field are enumerated in sorted order, so are the entities of the store.
+
+        :param index_dir: annotation-only index
+        :param store_dir: output directory
+        """
+        from org.apache.lucene.index import MultiFields, PostingsEnum
+        from org.apache.lucene.search import DocIdSetIterator
+        from org.apache.lucene.util import BytesRefIterator
+        from nordlys.tagme.lucene_tools import Lucene
+
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        index = Lucene(index_dir)
+        index.open_reader()
+        reader = index.get_reader()
+        live_docs = MultiFields.getLiveDocs(reader)  # None if there is no deleted document
+        terms_enum = MultiFields.getTerms(reader, Lucene.FIELDNAME_CONTENTS).iterator()
+
+        entities = open(os.path.join(store_dir, InLinks.ENTITIES_FILE), "w")
+        postings = open(os.path.join(store_dir, InLinks.POSTINGS_FILE), "wb")
+        offsets = [0]
+        i = 0
+        for term in BytesRefIterator.cast_(terms_enum):
+            docs_enum = terms_enum.postings(None, PostingsEnum.NONE)
+            doc_ids = array("i")
+            doc_id = docs_enum.nextDoc()
+            while doc_id != DocIdSetIterator.NO_MORE_DOCS:
+                if (live_docs is None) or live_docs.get(doc_id):
+                    doc_ids.append(doc_id)
+                doc_id = docs_enum.nextDoc()
+            entities.write(term.utf8ToString().encode("utf-8") + "\n")
+            doc_ids.tofile(postings)
+            offsets.append(offsets[-1] + len(doc_ids))
+            i += 1
+            if i % 1000000 == 0:
+                print "Processed", i, "th entity!"
+        entities.close()
+        postings.close()
+        np.array(offsets, dtype=np.int64).tofile(os.path.join(store_dir, InLinks.OFFSETS_FILE))
+        with open(os.path.join(store_dir, InLinks.NUM_DOCS_FILE), "w") as num_docs:
+            num_docs.write(str(reader.numDocs()) + "\n")
+        print "In-links of", i, "entities are written to", store_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-index", help="Path to annotation-only index")
+    parser.add_argument("-outputdir", help="Path to write the in-link store")
+    args = parser.parse_args()
+
+    InLinks.build(args.index, args.outputdir)
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,22 @@ class Mongo(object):
 
         return doc
 
+    def find_by_ids(self, doc_ids):
+        """
+        Returns all document contents for the given document ids, using a single query.
+
+        :param doc_ids: list of document ids
+        :return: {doc_id: doc, ...}; ids of non-existing documents are not included
+        """
+        docs = {}
+        if len(doc_ids) == 0:
+            return docs
+        query_doc = {Mongo.ID_FIELD: {"$in": [self.escape(doc_id) for doc_id in set(doc_ids)]}}
+        for mdoc in self.collection.find(query_doc):
+            doc = self.get_doc(mdoc)
+            docs[doc[Mongo.ID_FIELD]] = doc
+        return docs
+
     def get_doc(self, mdoc):
         """Returns document contents with with keys and _id field unescaped."""
         if mdoc is None:
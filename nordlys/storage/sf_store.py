@@ -0,0 +1,186 @@
+"""
+Read-only, memory-mapped surface form dictionary.
+
+An embedded alternative to the MongoDB surface form collection: surface forms are kept in a sorted key table,
+each pointing to packed (entity id, source, count) records. get() returns the same output as SurfaceForms.get().
+
+Files of the store:
+  - keys.bin, key_offsets.bin: sorted surface forms (StringTable)
+  - record_offsets.bin: int64 array; records of the i-th key are records[record_offsets[i]:record_offsets[i+1]]
+  - records.bin: packed records (entity id, source id, count)
+  - entities.bin, entity_offsets.bin: entity URIs, indexed by entity id (StringTable)
+  - sources.txt: source names (e.g., anchor, title), indexed by source id
+  - link_probs.bin (optional): precomputed link probabilities of the keys (see nordlys.wikipedia.link_probs)
+
+Usage:
+  python -m nordlys.storage.sf_store -json path/to/sf_dict_mongo.json -outputdir path/to/sf_store
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import json
+import os
+import struct
+import numpy as np
+from nordlys.storage.arrays import load_array, StringTable, StringTableWriter
+from nordlys.storage.mongo import Mongo
+
+
+class SurfaceFormStore(object):
+    KEYS_FILE = "keys.bin"
+    KEY_OFFSETS_FILE = "key_offsets.bin"
+    RECORD_OFFSETS_FILE = "record_offsets.bin"
+    RECORDS_FILE = "records.bin"
+    ENTITIES_FILE = "entities.bin"
+    ENTITY_OFFSETS_FILE = "entity_offsets.bin"
+    SOURCES_FILE = "sources.txt"
+    LINK_PROBS_FILE = "link_probs.bin"
+
+    RECORD_DTYPE = np.dtype([("entity", "<i4"), ("source", "u1"), ("count", "<i4")])
+    # freq is the number of documents containing the surface form; -1 if link probability is not computed
+    LINK_PROB_DTYPE = np.dtype([("freq", "<i8"), ("wiki", "<f8"), ("facc", "<f8")])
+    # the field holding link probabilities in surface form documents: {"freq": n, "wiki": lp, ...}
+    LINK_PROB_FIELD = "link_prob"
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.keys = StringTable(self.__path(self.KEYS_FILE), self.__path(self.KEY_OFFSETS_FILE))
+        self.record_offsets = load_array(self.__path(self.RECORD_OFFSETS_FILE), np.int64)
+        self.records = load_array(self.__path(self.RECORDS_FILE), self.RECORD_DTYPE)
+        self.entities = StringTable(self.__path(self.ENTITIES_FILE), self.__path(self.ENTITY_OFFSETS_FILE))
+        with open(self.__path(self.SOURCES_FILE), "r") as sources:
+            self.sources = [line.rstrip("\n") for line in sources]
+        self.link_probs = None
+        if os.path.exists(self.__path(self.LINK_PROBS_FILE)):
+            self.link_probs = load_array(self.__path(self.LINK_PROBS_FILE), self.LINK_PROB_DTYPE)
+        print "Connected to surface form store " + store_dir
+
+    def __path(self, file_name):
+        return os.path.join(self.store_dir, file_name)
+
+    def get(self, surface_form):
+        """Returns all information associated with a surface form: {source: {en: count, ...}, ...}"""
+        pos = self.keys.find(surface_form)
+        if pos is None:
+            return None
+        return self.get_doc(pos)
+
+    def get_doc(self, pos):
+        """Returns information associated with the surface form at the given position of the key table."""
+        doc = {}
+        records = self.records[int(self.record_offsets[pos]):int(self.record_offsets[pos + 1])]
+        for en_id, source_id, count in records.tolist():
+            source = self.sources[source_id]
+            if source not in doc:
+                doc[source] = {}
+            doc[source][self.entities[en_id]] = count
+        if (self.link_probs is not None) and (self.link_probs[pos]["freq"] != -1):
+            freq, wiki_lp, facc_lp = self.link_probs[pos].tolist()
+            doc[self.LINK_PROB_FIELD] = {"freq": freq, "wiki": wiki_lp}
+            if "facc" in doc:
+                doc[self.LINK_PROB_FIELD]["facc"] = facc_lp
+        return doc
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class SurfaceFormStoreWriter(object):
+    """Writes a surface form store; surface forms should be added in sorted order."""
+
+    def __init__(self, store_dir):
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        self.store_dir = store_dir
+        self.keys = StringTableWriter(self.__path(SurfaceFormStore.KEYS_FILE),
+                                      self.__path(SurfaceFormStore.KEY_OFFSETS_FILE))
+        self.entities = StringTableWriter(self.__path(SurfaceFormStore.ENTITIES_FILE),
+                                          self.__path(SurfaceFormStore.ENTITY_OFFSETS_FILE))
+        self.records = open(self.__path(SurfaceFormStore.RECORDS_FILE), "wb")
+        self.record_offsets = open(self.__path(SurfaceFormStore.RECORD_OFFSETS_FILE), "wb")
+        self.record_offsets.write(struct.pack("<q", 0))
+        self.num_records = 0
+        self.entity_ids = {}
+        self.source_ids = {}
+        self.last_sf = None
+
+    def __path(self, file_name):
+        return os.path.join(self.store_dir, file_name)
+
+    def __get_id(self, ids, key):
+        if key not in ids:
+            ids[key] = len(ids)
+            if ids is self.entity_ids:
+                self.entities.add(key)
+        return ids[key]
+
+    def add(self, surface_form, doc):
+        """
+        Adds a surface form to the store.
+
+        :param surface_form: surface form (unescaped)
+        :param doc: {source: {en: count, ...}, ...}
+        """
+        surface_form = StringTable.encode(surface_form)
+        if (self.last_sf is not None) and (surface_form <= self.last_sf):
+            raise Exception("Surface forms should be added in sorted order: " + surface_form)
+        self.last_sf = surface_form
+        self.keys.add(surface_form)
+        records = []
+        for source in sorted(doc):
+            if source == SurfaceFormStore.LINK_PROB_FIELD:  # link probabilities are stored separately
+                continue
+            source_id = self.__get_id(self.source_ids, source)
+            for en, count in sorted(doc[source].iteritems()):
+                records.append((self.__get_id(self.entity_ids, StringTable.encode(en)), source_id, count))
+        np.array(records, dtype=SurfaceFormStore.RECORD_DTYPE).tofile(self.records)
+        self.num_records += len(records)
+        self.record_offsets.write(struct.pack("<q", self.num_records))
+
+    def close(self):
+        self.keys.close()
+        self.entities.close()
+        self.records.close()
+        self.record_offsets.close()
+        with open(self.__path(SurfaceFormStore.SOURCES_FILE), "w") as sources:
+            for source, _ in sorted(self.source_ids.items(), key=lambda item: item[1]):
+                sources.write(source + "\n")
+        print "Surface form store is written to " + self.store_dir
+
+
+def build_from_json(json_file, store_dir):
+    """
+    Builds the store from the output of merge_sf (a json array of surface form documents in mongo format).
+
+    :param json_file: json file (e.g., sf_dict_mongo.json)
+    :param store_dir: output directory
+    """
+    print "Loading " + json_file + " ..."
+    entries = json.load(open(json_file, "r"))
+    sfs = []
+    for entry in entries:
+        doc = {}
+        for source, en_counts in entry.iteritems():
+            if source == Mongo.ID_FIELD:
+                continue
+            doc[source] = {Mongo.unescape(en): count for en, count in en_counts.iteritems()}
+        sfs.append((StringTable.encode(Mongo.unescape(entry[Mongo.ID_FIELD])), doc))
+    del entries
+    print "Writing the store ..."
+    writer = SurfaceFormStoreWriter(store_dir)
+    for sf, doc in sorted(sfs, key=lambda item: item[0]):
+        writer.add(sf, doc)
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-json", help="Path to surface form dictionary (json output of merge_sf)")
+    parser.add_argument("-outputdir", help="Path to write the surface form store")
+    args = parser.parse_args()
+
+    build_from_json(args.json, args.outputdir)
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,74 @@
 Entity surface forms stored in MongoDB.
 
 The surface form is used as _id. The associated entities are stored in key-value format.
+Alternatively, surface forms are read from an embedded, memory-mapped store (see nordlys.storage.sf_store).
 
 @author: Krisztian Balog (krisztian.balog@uis.no)
 """
 
 from nordlys.config import MONGO_DB, MONGO_HOST
 from nordlys.storage.mongo import Mongo
+from nordlys.storage.sf_store import SurfaceFormStore
 
 
 class SurfaceForms(object):
+    LINK_PROB_FIELD = SurfaceFormStore.LINK_PROB_FIELD
 
-    def __init__(self, collection):
+    def __init__(self, collection=None, store_dir=None):
+        """
+        :param collection: MongoDB collection of surface forms
+        :param store_dir: surface form store; if given, it is used instead of MongoDB
+        """
         self.collection = collection
-        self.mongo = Mongo(MONGO_HOST, MONGO_DB, self.collection)
+        self.store = None
+        self.mongo = None
+        if store_dir:
+            self.store = SurfaceFormStore(store_dir)
+        else:
+            self.mongo = Mongo(MONGO_HOST, MONGO_DB, self.collection)
 
     def get(self, surface_form):
         """Returns all information associated with a surface form."""
+        if self.store is not None:
+            return self.store.get(surface_form)
 
         # need to unescape the keys in the value part
         mdoc = self.mongo.find_by_id(surface_form)
+        return self.__unescape_doc(mdoc)
+
+    def get_many(self, surface_forms):
+        """
+        Returns all information associated with multiple surface forms, using a single lookup.
+
+        :param surface_forms: list of surface forms
+        :return: {surface_form: {source: {en: count, ...}, ...}, ...}; unknown surface forms are not included
+        """
+        docs = {}
+        if self.store is not None:
+            for surface_form in set(surface_forms):
+                doc = self.store.get(surface_form)
+                if doc is not None:
+                    docs[surface_form] = doc
+            return docs
+
+        for surface_form, mdoc in self.mongo.find_by_ids(surface_forms).iteritems():
+            docs[surface_form] = self.__unescape_doc(mdoc)
+        return docs
+
+    def get_keys(self):
+        """Returns sorted sequence of all surface forms (utf-8 encoded)."""
+        if self.store is not None:
+            return self.store.keys
+        print "Loading surface forms from " + self.collection + " ..."
+        keys = []
+        for mdoc in self.mongo.collection.find({}, {Mongo.ID_FIELD: 1}):
+            keys.append(Mongo.unescape(mdoc[Mongo.ID_FIELD]).encode("utf-8"))
+        keys.sort()
+        return keys
+
+    @staticmethod
+    def __unescape_doc(mdoc):
+        """Unescapes the keys in the value part of a document."""
         if mdoc is None:
             return None
         doc = {}
@@ -30,4 +79,4 @@ class SurfaceForms(object):
                 for key, value in mdoc[f].iteritems():
                     doc[f][Mongo.unescape(key)] = value
 
-        return doc
\ No newline at end of file
+        return doc
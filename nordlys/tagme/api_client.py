@@ -0,0 +1,251 @@
+"""
+Concurrent HTTP client for the annotation APIs (TAGME, Dexter).
+
+Requests are sent by a pool of threads over a single session (with pooled, kept-alive connections), limited to a
+number of requests per second, and retried with exponential backoff on connection errors, timeouts and
+429/5xx responses. Results are returned in the order of the inputs, so the output files are the same as the ones
+of sequential runs. The endpoints can be pointed to a local stand-in server (e.g., nordlys.tagme.server).
+
+Harvesting runs can be resumed and repeated without network calls:
+  - ResponseCache: raw json responses, stored on disk and keyed by (method, endpoint, normalized parameters)
+  - Checkpoint: output file with an append-only log of the completed qids
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import json
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse, parse_qsl
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RateLimiter(object):
+    """Token bucket: allows `rate` requests per second on average, and bursts of up to `burst` requests."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_time = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request is allowed."""
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        # the token is already taken, so other threads can reserve the next ones while this one is waiting
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ResponseCache(object):
+    """
+    Persistent cache of json responses; an append-only file of {"key": .., "response": ..} lines, loaded at start.
+    Only successful responses are added.
+    """
+    FILE_NAME = "responses.jsonl"
+    IGNORED_PARAMS = {"key"}  # parameters not affecting the response (e.g., API key)
+
+    def __init__(self, cache_dir):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.file_name = os.path.join(cache_dir, self.FILE_NAME)
+        self.responses = {}
+        if os.path.exists(self.file_name):
+            with open(self.file_name, "r") as cache_file:
+                for line in cache_file:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:  # the last line of an interrupted run
+                        continue
+                    self.responses[item["key"]] = item["response"]
+            print len(self.responses), "responses are loaded from", self.file_name
+        self.out = open(self.file_name, "a")
+        self.lock = threading.Lock()
+
+    def get_key(self, method, uri, params=None):
+        """Returns the cache key of a request; parameters of the query string and of the request are merged."""
+        url = urlparse(uri)
+        all_params = parse_qsl(url.query) + sorted((params or {}).items())
+        all_params = sorted((str(k), self.__to_unicode(v)) for k, v in all_params if k not in self.IGNORED_PARAMS)
+        return json.dumps([method, url.scheme + "://" + url.netloc + url.path, all_params])
+
+    @staticmethod
+    def __to_unicode(value):
+        """Decodes byte strings (e.g., queries read from the data files) as utf-8; latin-1 if they are not utf-8."""
+        if not isinstance(value, str):
+            return unicode(value)
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return value.decode("latin-1")
+
+    def get(self, key):
+        """Returns the json response of the key, or None if it is not in the cache."""
+        response = self.responses.get(key)
+        return json.loads(response) if response is not None else None
+
+    def put(self, key, response):
+        """Adds a response (json string) to the cache."""
+        with self.lock:
+            self.responses[key] = response
+            self.out.write(json.dumps({"key": key, "response": response}) + "\n")
+            self.out.flush()
+
+    def close(self):
+        self.out.close()
+
+
+class Checkpoint(object):
+    """
+    Output file of a harvesting run that can be resumed.
+    The output of each query is appended to the file, followed by a line (qid, file size) in the checkpoint file.
+    When resumed, output written after the last checkpoint is truncated, and the completed qids are skipped.
+    """
+
+    def __init__(self, out_file_name, resume=False):
+        """
+        :param out_file_name: output file
+        :param resume: if True, the previous run is continued; otherwise, the output is overwritten
+        """
+        self.file_name = out_file_name + ".checkpoint"
+        self.done = set()
+        lines = []
+        offset = 0
+        if resume and os.path.exists(self.file_name):
+            with open(self.file_name, "r") as checkpoint:
+                for line in checkpoint:
+                    cols = line.rstrip("\n").split("\t")
+                    if (not line.endswith("\n")) or (len(cols) != 2):  # the last line of an interrupted run
+                        continue
+                    self.done.add(cols[0])
+                    lines.append(line)
+                    offset = int(cols[1])
+            print len(self.done), "queries are already done; resuming ..."
+        with open(out_file_name, "a") as out:
+            out.truncate(offset)
+        self.out = open(out_file_name, "a")
+        self.checkpoint = open(self.file_name, "w")
+        self.checkpoint.write("".join(lines))
+        self.checkpoint.flush()
+
+    def write(self, qid, out_str):
+        """Writes output of a query and marks it as done."""
+        self.out.write(out_str)
+        self.out.flush()
+        self.checkpoint.write(str(qid) + "\t" + str(self.out.tell()) + "\n")
+        self.checkpoint.flush()
+        self.done.add(str(qid))
+
+    def close(self):
+        self.out.close()
+        self.checkpoint.close()
+
+
+class APIClient(object):
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, workers=1, rate=None, max_retries=5, backoff=1.0, max_backoff=60, timeout=60,
+                 cache_dir=None):
+        """
+        :param workers: number of concurrent requests
+        :param rate: max number of requests per second (all workers); unlimited if None
+        :param max_retries: max number of retries of a request
+        :param backoff: wait before the first retry (seconds); doubled for each retry
+        :param max_backoff: max wait between two retries (seconds)
+        :param timeout: timeout of a request (seconds)
+        :param cache_dir: directory of the response cache; responses are not cached if None
+        """
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.num_requests = 0
+        self.num_retries = 0
+        self.num_cached = 0
+        self.lock = threading.Lock()  # for the counters
+
+    def request(self, method, uri, **kwargs):
+        """
+        Sends a request and returns the json response; the request is retried if it fails temporarily.
+        Cached responses are returned without sending the request.
+
+        :param method: GET or POST
+        :param uri: request uri
+        :param kwargs: arguments of requests.Session.request (e.g., data, params)
+        :return: json response
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.get_key(method, uri, kwargs.get("data") or kwargs.get("params"))
+            response = self.cache.get(cache_key)
+            if response is not None:
+                with self.lock:
+                    self.num_cached += 1
+                return response
+
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            with self.lock:
+                self.num_requests += 1
+            retry_after = None
+            try:
+                res = self.session.request(method, uri, timeout=self.timeout, **kwargs)
+                if res.status_code not in self.RETRY_STATUSES:
+                    res.raise_for_status()
+                    if cache_key is not None:
+                        self.cache.put(cache_key, res.text)
+                    return res.json()
+                error = "HTTP " + str(res.status_code)
+                retry_after = res.headers.get("Retry-After")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = str(e)
+            if attempt >= self.max_retries:
+                raise Exception("Request failed after " + str(attempt) + " retries (" + error + "): " + uri)
+            wait = min(self.backoff * (2 ** attempt), self.max_backoff)
+            if (retry_after is not None) and retry_after.isdigit():
+                wait = max(wait, int(retry_after))
+            print "Request failed (" + error + "); retrying in", wait, "seconds ..."
+            time.sleep(wait)
+            attempt += 1
+            with self.lock:
+                self.num_retries += 1
+
+    def post(self, uri, data):
+        return self.request("POST", uri, data=data)
+
+    def get(self, uri, params=None):
+        return self.request("GET", uri, params=params)
+
+    def imap(self, func, items):
+        """
+        Applies the function to the items using the worker threads.
+
+        :return: iterator over the results, in the order of the items (available as soon as they are done)
+        """
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap(func, items):
+                yield result
+        finally:
+            pool.terminate()
+
+    def stats(self):
+        return {'requests': self.num_requests, 'retries': self.num_retries, 'cached': self.num_cached}
@@ -5,7 +5,6 @@ Configurations for tagme package.
 """
 
 from nordlys.config import DATA_DIR
-from nordlys.storage.surfaceforms import SurfaceForms
 
 
 # Test collection files
@@ -22,10 +21,37 @@ WIKI_DISAMB30 = DATA_DIR + "/wiki-disamb30"
 WIKI_DISAMB30_SNIPPET = DATA_DIR + "/wiki-disamb30-snippet.txt"
 WIKI_DISAMB30_ANNOTATION = DATA_DIR + "/wiki-disamb30-annotation.txt"
 
-# Surface form dictionaries
+# Surface form dictionaries (opened on first use; see nordlys.tagme.resources)
 COLLECTION_SURFACEFORMS_WIKI = "surfaceforms_wiki-20180615"
-SF_WIKI = SurfaceForms(collection=COLLECTION_SURFACEFORMS_WIKI)
+# Surface form store built from the same dictionary (nordlys.storage.sf_store); replaces MongoDB lookups if set
+SURFACEFORMS_WIKI_STORE = None
+# Spots query n-grams using the surface form keys, instead of looking up all n-grams in the dictionary
+USE_SPOTTER = False
 
 
 INDEX_PATH = "/datadrive/index"
 INDEX_ANNOT_PATH = "/datadrive/index-annot/"
+
+# In-link store built from the annotation index (nordlys.storage.inlinks); replaces INDEX_ANNOT_PATH lookups if set
+INLINKS_PATH = None
+
+# Entity id store built from page-id-titles.txt (nordlys.storage.entity_ids); if None, ids are assigned on first use
+ENTITY_IDS_PATH = None
+
+# Candidate table built from the surface form store (nordlys.storage.candidates); needs ENTITY_IDS_PATH of the same
+# build. If set, candidate entities are read from the table instead of being computed from the surface forms.
+CANDIDATES_PATH = None
+
+# Bounded disambiguation: candidates below the commonness threshold are dropped before voting, and at most this
+# number of candidates (with the highest commonness) are kept for each mention; exact TAGME if None
+MAX_CANDIDATES = None
+
+# Caches of in-link counts and MW relatedness, shared by all queries (max number of items)
+IN_LINKS_CACHE_SIZE = 5000000
+MW_REL_CACHE_SIZE = 5000000
+# Cache of annotations (raw scores of all linked mentions), keyed by normalized query (max number of queries)
+RESULT_CACHE_SIZE = 100000
+# Directory for saving the caches at the end of a run and loading them in the next run; disabled if None.
+# The result cache is only saved for the surface form store (MongoDB collections carry no version).
+# Saved caches are not loaded if the resources changed since (e.g., rebuilt or updated indexes).
+CACHE_DIR = None
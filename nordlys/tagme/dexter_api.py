@@ -5,10 +5,11 @@ Methods to annotate queries with TagMe API.
 """
 
 import argparse
+from itertools import izip
 
-import requests
 from nordlys.config import OUTPUT_DIR
 
+from nordlys.tagme.api_client import APIClient, Checkpoint
 from nordlys.tagme.test_coll import read_tagme_queries, read_yerd_queries, read_erd_queries
 from nordlys.wikipedia.utils import WikipediaUtils
 from nordlys.tagme import config
@@ -18,54 +19,69 @@ class DexterAPI(object):
     ANNOT_DEXTER_URI = "http://dexterdemo.isti.cnr.it:8080/dexter-webapp/api/rest/annotate?min-conf=0"
     DESC_DEXTER_URI = "http://dexterdemo.isti.cnr.it:8080/dexter-webapp/api/rest/get-desc"
 
-    def __init__(self):
+    def __init__(self, annot_uri=ANNOT_DEXTER_URI, desc_uri=DESC_DEXTER_URI, client=None):
+        """
+        :param annot_uri: annotation endpoint
+        :param desc_uri: entity description endpoint
+        :param client: APIClient object (concurrency, rate limit and retries); a sequential client if None
+        """
+        self.annot_uri = annot_uri
+        self.desc_uri = desc_uri
+        self.client = client if client is not None else APIClient()
         self.id_title_dict = {}
 
     def ask_dexter_query(self, query):
         """Sends queries to Dexter Api."""
         data = {'dsb': "tagme", 'n': "50", 'debug': "false", 'format': "text", 'text': query}
-        res = requests.post(self.ANNOT_DEXTER_URI, data).json()
+        res = self.client.post(self.annot_uri, data)
         res['query'] = query
         return res
 
+    def ask_dexter_query_titles(self, query):
+        """Sends queries to Dexter Api and gets the titles of the annotated entities (added to the spots as uri)."""
+        res = self.ask_dexter_query(query)
+        for annot in res['spots']:
+            annot['uri'] = self.ask_title(annot.get('entity', "*NONE*"))
+        return res
+
     def ask_title(self, page_id):
         """Sends page id to the API and get the page title."""
-        if page_id not in self.id_title_dict:
+        id_title_dict = self.id_title_dict  # the cache may be replaced by another thread
+        if page_id not in id_title_dict:
             req = "?id=" + str(page_id) + "&title-only=true"
-            res = requests.get(self.DESC_DEXTER_URI + req).json()
+            res = self.client.get(self.desc_uri + req)
             title = res.get('title', "")
-            wiki_uri = WikipediaUtils.wiki_title_to_uri(title.encode("utf-8"))
-            self.id_title_dict[page_id] = wiki_uri
-        return self.id_title_dict[page_id]
+            id_title_dict[page_id] = WikipediaUtils.wiki_title_to_uri(title.encode("utf-8"))
+        return id_title_dict[page_id]
 
-    def aks_dexter_queries(self, queries, out_file):
+    def aks_dexter_queries(self, queries, out_file, resume=False):
         """
         Sends queries to Dexter Api and writes them in a json file.
+        The output of each query is written as soon as it is received (see Checkpoint).
 
         :param queries: dictionary {qid: query, ...}
         :param out_file: The file to write json output
+        :param resume: if True, continues a previous (interrupted) run
         """
         print "Getting resutls from Tagme ..."
         # responses = {}
-        out_str = ""
-        open(out_file, "w").close()
-        out = open(out_file, "a")
+        out = Checkpoint(out_file, resume)
         i = 0
-        for qid in sorted(queries, key=lambda item: int(item) if item.isdigit() else item):
-            query = queries[qid]
-            print "[" + qid + "]", query
-            tagme_res = self.ask_dexter_query(query)
-            out_str += self.__to_str(qid, tagme_res)
-            out.write(out_str)
-            out_str = ""
+        qids = [qid for qid in sorted(queries, key=lambda item: int(item) if item.isdigit() else item)
+                if qid not in out.done]
+        # queries (and titles of their entities) are sent concurrently, and the responses are written in the qid order
+        responses = self.client.imap(self.ask_dexter_query_titles, [queries[qid] for qid in qids])
+        for qid, tagme_res in izip(qids, responses):
+            print "[" + qid + "]", queries[qid]
+            out.write(qid, self.__to_str(qid, tagme_res))
             i += 1
             if i % 100 == 0:
-                # out.write(out_str)
                 print i, "th query processed ...."
                 print "items ins the page-id cache:", len(self.id_title_dict)
+                # titles are kept in the response cache (if used), so the in-memory cache can be cleared
                 self.id_title_dict = {}
-                # out_str = ""
-        out.write(out_str)
+        out.close()
+        print "requests:", self.client.stats()
         # json.dump(responses, open(out_file, "w"), indent=4, sort_keys=True)
         print "Dexter results: " + out_file
         # return responses
@@ -83,7 +99,7 @@ class DexterAPI(object):
         none_str = "*NONE*"
         out_str = ""
         for annot in response['spots']:
-            wiki_uri = self.ask_title(annot.get('entity', none_str))
+            wiki_uri = annot['uri']
             if wiki_uri is None:
                 continue
             qid_str = str(qid) + "\t" + str(annot.get('score', none_str)) + "\t" + wiki_uri + "\t" + \
@@ -101,6 +117,14 @@ def main():
     parser.add_argument("-th", "--threshold", help="rho score threshold", type=float, default=0)
     parser.add_argument("-qid", help="annotates queries from this qid", type=str)
     parser.add_argument("-data", help="Data set name", choices=['y-erd', 'erd-dev', 'wiki-annot30', 'wiki-disamb30'])
+    parser.add_argument("-uri", help="Dexter annotation endpoint", default=DexterAPI.ANNOT_DEXTER_URI)
+    parser.add_argument("-descuri", help="Dexter entity description endpoint", default=DexterAPI.DESC_DEXTER_URI)
+    parser.add_argument("-workers", help="Number of concurrent requests", type=int, default=1)
+    parser.add_argument("-rate", help="Max number of requests per second", type=float)
+    parser.add_argument("-retries", help="Max number of retries of a failed request", type=int, default=5)
+    parser.add_argument("-cachedir", help="Directory of the response cache (responses are reused by next runs)")
+    parser.add_argument("-resume", help="Continues the previous run from its checkpoint", action="store_true",
+                        default=False)
     args = parser.parse_args()
 
     if args.data == "erd-dev":
@@ -115,8 +139,9 @@ def main():
     # asks tagMe and creates output file
     qid_str = "_" + args.qid if args.qid else ""
     out_file = OUTPUT_DIR + "/" + args.data + "_dexter" + qid_str + ".txt"
-    tagme = DexterAPI()
-    tagme.aks_dexter_queries(queries, out_file)
+    client = APIClient(args.workers, args.rate, args.retries, cache_dir=args.cachedir)
+    tagme = DexterAPI(args.uri, args.descuri, client)
+    tagme.aks_dexter_queries(queries, out_file, args.resume)
 
 
 if __name__ == '__main__':
@@ -23,6 +23,8 @@ from org.apache.lucene.index import IndexWriterConfig
 from org.apache.lucene.index import DirectoryReader 
 from org.apache.lucene.index import Term
 from org.apache.lucene.index import IndexOptions
+from org.apache.lucene.index import LogByteSizeMergePolicy
+from org.apache.lucene.index import TieredMergePolicy
 from org.apache.lucene.search import IndexSearcher
 from org.apache.lucene.search import BooleanClause
 from org.apache.lucene.search import TermQuery
@@ -120,15 +122,45 @@ class Lucene(object):
         self.open_searcher()
         return self.searcher
 
-    def open_writer(self):
-        """Open IndexWriter."""
+    def open_writer(self, ram_buffer_mb=None, merge_policy=None, merge_factor=None, create=True):
+        """
+        Open IndexWriter.
+
+        :param ram_buffer_mb: size of the RAM buffer (MB); documents are flushed to a new segment when it is full
+        :param merge_policy: "tiered" or "logbyte"; Lucene default (tiered) if None
+        :param merge_factor: number of segments merged at once (and segments per tier, for the tiered policy)
+        :param create: if False, documents are added to the existing index
+        """
         if self.writer is None:
             config = IndexWriterConfig(self.get_analyzer())
-            config.setOpenMode(IndexWriterConfig.OpenMode.CREATE)
+            if create:
+                config.setOpenMode(IndexWriterConfig.OpenMode.CREATE)
+            else:
+                config.setOpenMode(IndexWriterConfig.OpenMode.APPEND)
+            if ram_buffer_mb is not None:
+                config.setRAMBufferSizeMB(float(ram_buffer_mb))
+            if merge_policy == "tiered":
+                policy = TieredMergePolicy()
+                if merge_factor is not None:
+                    policy.setMaxMergeAtOnce(merge_factor)
+                    policy.setSegmentsPerTier(float(merge_factor))
+                config.setMergePolicy(policy)
+            elif merge_policy == "logbyte":
+                policy = LogByteSizeMergePolicy()
+                if merge_factor is not None:
+                    policy.setMergeFactor(merge_factor)
+                config.setMergePolicy(policy)
+            elif merge_policy is not None:
+                raise Exception("Unknown merge policy " + merge_policy)
             self.writer = IndexWriter(self.dir, config)
         else:
             raise Exception("IndexWriter is already open")
 
+    @staticmethod
+    def attach_current_thread():
+        """Attaches the current (Python) thread to the JVM; needed before using Lucene in a new thread."""
+        lucene.getVMEnv().attachCurrentThread()
+
     def close_writer(self):
         """Close IndexWriter."""
         if self.writer is not None:
@@ -147,6 +179,11 @@ class Lucene(object):
         doc = self.ldf.create_document(contents)
         self.writer.addDocument(doc)
 
+    def delete_documents(self, doc_ids):
+        """Deletes the documents with the given (external) ids from the index."""
+        for doc_id in doc_ids:
+            self.writer.deleteDocuments(Term(self.FIELDNAME_ID, doc_id))
+
     def get_lucene_document_id(self, doc_id):
         """Loads a document from a Lucene index based on its id."""
         self.open_searcher()
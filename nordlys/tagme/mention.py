@@ -6,14 +6,28 @@ Tools for processing mentions:
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 
-from nordlys.tagme.config import SF_WIKI
+from collections import OrderedDict
+from nordlys.storage.surfaceforms import SurfaceForms
+from nordlys.tagme.resources import get_resources
 
 
 class Mention(object):
 
-    def __init__(self, text):
+    def __init__(self, text, matched_ens=None, sf_dict=None, entity_ids=None, candidates=None):
+        """
+        :param text: mention text
+        :param matched_ens: surface form dictionary entry of the mention, if it is already fetched
+        :param sf_dict: surface form dictionary (SurfaceForms object); the default dictionary is used if None
+        :param entity_ids: if given (EntityIds object), candidate entities are returned with their integer ids
+        :param candidates: if given (CandidateTable object), anchor occurrences, link probabilities and candidate
+            entities (with ids) are read from the table
+        """
         self.text = text.lower()
-        self.__matched_ens = None       # all entities matching a mention (from all sources)
+        self.__sf_dict = sf_dict
+        self.__entity_ids = entity_ids
+        self.__candidates = candidates
+        self.__cand_pos = candidates.find(self.text) if candidates is not None else None
+        self.__matched_ens = matched_ens       # all entities matching a mention (from all sources)
         self.__wiki_occurrences = None
 
     @property
@@ -24,16 +38,27 @@ class Mention(object):
     def wiki_occurrences(self):
         return self.__calc_wiki_occurrences()
 
+    @property
+    def link_probs(self):
+        """Precomputed link probabilities {"freq": n, "wiki": lp, ...}; empty if they are not available."""
+        if self.__candidates is not None:
+            return self.__candidates.get_link_probs(self.__cand_pos) if self.__cand_pos is not None else {}
+        return self.matched_ens.get(SurfaceForms.LINK_PROB_FIELD, {})
+
     def __gen_matched_ens(self):
         """Gets all entities matching the n-gram"""
         if self.__matched_ens is None:
-            matches = SF_WIKI.get(self.text)  # Queries mongodb surface form dictionary
+            sf_dict = self.__sf_dict if self.__sf_dict is not None else get_resources().sf_wiki
+            matches = sf_dict.get(self.text)  # Queries mongodb surface form dictionary
             matched_ens = matches if matches is not None else {}
             self.__matched_ens = matched_ens
         return self.__matched_ens
 
     def __calc_wiki_occurrences(self):
         """Calculates the denominator for commonness (for Wiki annotations)."""
+        if (self.__wiki_occurrences is None) and (self.__candidates is not None):
+            self.__wiki_occurrences = self.__candidates.get_occurrences(self.__cand_pos) \
+                if self.__cand_pos is not None else 0
         if self.__wiki_occurrences is None:
             self.__wiki_occurrences = 0
             for en, occ in self.matched_ens.get('anchor', {}).iteritems():
@@ -45,23 +70,36 @@ class Mention(object):
         Gets candidate entities for the given n-gram.
 
         :param commonness_th: commonness threshold
-        :return: dictionary {Wiki_uri: commonness, ..}
+        :return: dictionary {Wiki_uri: commonness, ..}; {en_id: commonness, ..} if entity ids are used
         """
+        if self.__from_candidates(commonness_th):
+            return self.get_wiki_matches(commonness_th)
         candidate_entities = {}
         wiki_matches = self.get_wiki_matches(commonness_th)
         candidate_entities.update(wiki_matches)
+        if self.__entity_ids is not None:
+            # ids are kept in the iteration order of the uris, so that ties are broken the same way
+            return OrderedDict((self.__entity_ids.get_id(wiki_uri), cmn)
+                               for wiki_uri, cmn in candidate_entities.iteritems())
         return candidate_entities
 
+    def __from_candidates(self, commonness_th):
+        """Returns True if the candidates are read from the candidate table."""
+        # candidates of the table are precomputed for a fixed threshold
+        return (self.__candidates is not None) and (commonness_th == self.__candidates.CMN_TH)
+
     def get_wiki_matches(self, commonness_th):
         """
         Gets entity matches from Wikipedia anchors (with dbpedia uris).
 
         :param commonness_th: float, Commonness threshold
-        :return: Dictionary {Wiki_uri: commonness, ...}
+        :return: Dictionary {Wiki_uri: commonness, ...}; {en_id: commonness, ...} if read from the candidate table
 
         """
         if commonness_th is None:
             commonness_th = 0
+        if self.__from_candidates(commonness_th):
+            return self.__candidates.get_candidates(self.__cand_pos) if self.__cand_pos is not None else {}
 
         wiki_matches = {}
         # calculates commonness for each entity and filter the ones below the commonness threshold.
@@ -0,0 +1,145 @@
+"""
+Per-query metrics of the TAGME pipeline: wall time of the stages and counters of the lookups.
+
+Each Tagme object records its metrics in a Metrics object (Tagme.metrics):
+  - times (seconds): ngrams, sf_lookup (dictionary lookup and candidate entities), link_prob, relatedness
+    (MW relatedness matrix), voting, dt_pruning, avg_pruning
+  - counters: ngrams, lucene_searches, mongo_lookups, sf_store_lookups, inlink_store_lookups,
+    in_links_cache_hits/misses, mw_rel_cache_hits/misses
+Metrics of a run are written to a JSON-lines trace (one record per query), and summarized as latency percentiles
+and histograms of the stages.
+
+Usage (summarizes trace files):
+  python -m nordlys.tagme.metrics -trace path/to/trace.jsonl
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+class Metrics(object):
+    STAGES = ["ngrams", "sf_lookup", "link_prob", "relatedness", "voting", "dt_pruning", "avg_pruning"]
+
+    def __init__(self):
+        self.times = {}  # {stage: seconds, ...}
+        self.counters = {}  # {counter: count, ...}
+
+    @contextmanager
+    def timer(self, stage):
+        """Adds the wall time of the block to the stage."""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.time() - start_time)
+
+    def add_time(self, stage, seconds):
+        """Adds wall time to the stage."""
+        self.times[stage] = self.times.get(stage, 0) + seconds
+
+    def count(self, counter, n=1):
+        """Increments the counter."""
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def to_dict(self):
+        return {"times": self.times, "counters": self.counters}
+
+
+class Trace(object):
+    """Writes metrics of the queries to a JSON-lines file and keeps them for the summary."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.out = open(file_name, "w")
+        self.records = []
+
+    def add(self, qid, metrics, total_time):
+        """
+        Adds metrics of a query.
+
+        :param qid: query id
+        :param metrics: Metrics object
+        :param total_time: wall time of annotating the query (seconds)
+        """
+        record = {"qid": qid, "total": total_time}
+        record.update(metrics.to_dict())
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+        self.records.append(record)
+
+    def close(self):
+        self.out.close()
+
+
+# upper bounds (ms) of the histogram buckets; the last bucket holds the rest
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def read_trace(file_name):
+    """Reads records of a trace file."""
+    with open(file_name, "r") as trace:
+        return [json.loads(line) for line in trace if line.strip()]
+
+
+def summarize(records):
+    """
+    Summarizes metrics of the queries.
+
+    :param records: trace records
+    :return: {"queries": n, "times": {stage: {mean, p50, p90, p99, max, histogram}, ...},
+              "counters": {counter: {total, mean}, ...}}
+    """
+    summary = {"queries": len(records), "times": {}, "counters": {}}
+    if len(records) == 0:
+        return summary
+    for stage in Metrics.STAGES + ["total"]:
+        # stages that are not run for a query (e.g., no mentions) take no time
+        times = np.array([(r["total"] if stage == "total" else r["times"].get(stage, 0)) * 1000 for r in records])
+        histogram = np.bincount(np.searchsorted(HISTOGRAM_BUCKETS, times), minlength=len(HISTOGRAM_BUCKETS) + 1)
+        summary["times"][stage] = {"mean": float(np.mean(times)), "p50": float(np.percentile(times, 50)),
+                                   "p90": float(np.percentile(times, 90)), "p99": float(np.percentile(times, 99)),
+                                   "max": float(np.max(times)), "histogram": histogram.tolist()}
+    counters = sorted({c for r in records for c in r["counters"]})
+    for counter in counters:
+        total = sum(r["counters"].get(counter, 0) for r in records)
+        summary["counters"][counter] = {"total": total, "mean": total / float(len(records))}
+    return summary
+
+
+def print_summary(summary):
+    """Prints the summary as tables."""
+    print "=========== Metrics of", summary["queries"], "queries ==========="
+    if summary["queries"] == 0:
+        return
+    print "stage (ms)".ljust(14), "".join(c.rjust(10) for c in ["mean", "p50", "p90", "p99", "max"])
+    for stage in Metrics.STAGES + ["total"]:
+        stats = summary["times"][stage]
+        print stage.ljust(14), "".join(("%.2f" % stats[c]).rjust(10) for c in ["mean", "p50", "p90", "p99", "max"])
+    print
+    print "histogram (ms)".ljust(14), "".join(("<=" + str(b)).rjust(7) for b in HISTOGRAM_BUCKETS), \
+        (">" + str(HISTOGRAM_BUCKETS[-1])).rjust(7)
+    for stage in Metrics.STAGES + ["total"]:
+        print stage.ljust(14), "".join(str(n).rjust(7) for n in summary["times"][stage]["histogram"])
+    print
+    print "counter".ljust(24), "total".rjust(10), "mean".rjust(10)
+    for counter, stats in sorted(summary["counters"].items()):
+        print counter.ljust(24), str(stats["total"]).rjust(10), ("%.2f" % stats["mean"]).rjust(10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-trace", help="Trace file(s)", nargs="+")
+    args = parser.parse_args()
+
+    records = []
+    for file_name in args.trace:
+        records += read_trace(file_name)
+    print_summary(summarize(records))
+
+if __name__ == "__main__":
+    main()
@@ -22,13 +22,18 @@ class Query(object):
         cleaned_str = ' '.join(input_str.split())
         return cleaned_str
 
-    def get_ngrams(self):
+    def get_ngrams(self, spotter=None):
         """
         Finds all n-grams of the query.
+        If a spotter is given, only the n-grams found in the surface form dictionary are returned (in the same order).
 
+        :param spotter: nordlys.tagme.spotter.Spotter object
         :return list of n-grams
         """
         con = self.query.strip().split()
+        if spotter is not None:
+            spots = sorted(spotter.spot(con), key=lambda item: (item[1] - item[0], item[0]))
+            return [ngram for _, _, ngram in spots]
         ngrams = []
         for i in range(1, len(con) + 1):  # number of words
             for start in range(0, len(con) - i + 1):  # start point
@@ -0,0 +1,174 @@
+"""
+Resources used by TAGME: Lucene indexes, in-link store, surface form dictionary, spotter, entity ids, and
+candidate table.
+
+Each resource is opened on first use (and then kept open), so that importing TAGME modules does not start the
+JVM, open the indexes or connect to MongoDB. Paths default to the values in nordlys.tagme.config; already opened
+objects can also be injected, e.g., Resources(sf_wiki=SurfaceForms(store_dir=...)).
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import os
+from hashlib import md5
+from nordlys.tagme import config
+
+# marks resources that are not opened yet (None is a valid value for optional resources)
+_UNSET = object()
+
+
+class Resources(object):
+
+    def __init__(self, index_path=None, annot_index_path=None, inlinks_path=None, sf_collection=None,
+                 sf_store=None, use_spotter=None, entity_ids_path=None, candidates_path=None, entity_index=_UNSET,
+                 annot_index=_UNSET, in_links=_UNSET, sf_wiki=_UNSET, spotter=_UNSET, entity_ids=_UNSET,
+                 candidates=_UNSET):
+        """
+        :param index_path: full-text index
+        :param annot_index_path: annotation-only index
+        :param inlinks_path: in-link store; if set, the annotation index is not used
+        :param sf_collection: MongoDB collection of surface forms
+        :param sf_store: surface form store; if set, it is used instead of MongoDB
+        :param use_spotter: if True, query n-grams are spotted using the surface form keys
+        :param entity_ids_path: entity id store
+        :param candidates_path: candidate table; if set, candidate entities are read from it
+        The remaining parameters are resource objects to be used as they are.
+        """
+        self.index_path = index_path if index_path is not None else config.INDEX_PATH
+        self.annot_index_path = annot_index_path if annot_index_path is not None else config.INDEX_ANNOT_PATH
+        self.inlinks_path = inlinks_path if inlinks_path is not None else config.INLINKS_PATH
+        self.sf_collection = sf_collection if sf_collection is not None else config.COLLECTION_SURFACEFORMS_WIKI
+        self.sf_store = sf_store if sf_store is not None else config.SURFACEFORMS_WIKI_STORE
+        self.use_spotter = use_spotter if use_spotter is not None else config.USE_SPOTTER
+        self.entity_ids_path = entity_ids_path if entity_ids_path is not None else config.ENTITY_IDS_PATH
+        self.candidates_path = candidates_path if candidates_path is not None else config.CANDIDATES_PATH
+        self.__entity_index = entity_index
+        self.__annot_index = annot_index
+        self.__in_links = in_links
+        self.__sf_wiki = sf_wiki
+        self.__spotter = spotter
+        self.__entity_ids = entity_ids
+        self.__candidates = candidates
+        self.__version = None
+
+    @property
+    def entity_index(self):
+        """Full-text index (Lucene object with open searcher)."""
+        if self.__entity_index is _UNSET:
+            from nordlys.tagme.lucene_tools import Lucene
+            self.__entity_index = Lucene(self.index_path)
+            self.__entity_index.open_searcher()
+        return self.__entity_index
+
+    @property
+    def annot_index(self):
+        """Annotation-only index, loaded into RAM (Lucene object with open searcher)."""
+        if self.__annot_index is _UNSET:
+            from nordlys.tagme.lucene_tools import Lucene
+            self.__annot_index = Lucene(self.annot_index_path, use_ram=True)
+            self.__annot_index.open_searcher()
+        return self.__annot_index
+
+    @property
+    def in_links(self):
+        """In-link store; None if it is not configured."""
+        if self.__in_links is _UNSET:
+            from nordlys.storage.inlinks import InLinks
+            self.__in_links = InLinks(self.inlinks_path) if self.inlinks_path else None
+        return self.__in_links
+
+    @property
+    def sf_wiki(self):
+        """Surface form dictionary (SurfaceForms object)."""
+        if self.__sf_wiki is _UNSET:
+            from nordlys.storage.surfaceforms import SurfaceForms
+            self.__sf_wiki = SurfaceForms(collection=self.sf_collection, store_dir=self.sf_store)
+        return self.__sf_wiki
+
+    @property
+    def spotter(self):
+        """Spotter over the surface form keys; None if it is not used."""
+        if self.__spotter is _UNSET:
+            from nordlys.tagme.spotter import Spotter
+            self.__spotter = Spotter(self.sf_wiki.get_keys(), max_len=6) if self.use_spotter else None
+        return self.__spotter
+
+    @property
+    def entity_ids(self):
+        """Dictionary of entity URIs and integer ids (EntityIds object)."""
+        if self.__entity_ids is _UNSET:
+            from nordlys.storage.entity_ids import EntityIds
+            self.__entity_ids = EntityIds(self.entity_ids_path)
+        return self.__entity_ids
+
+    @property
+    def candidates(self):
+        """Candidate table; None if it is not configured. It is checked against the entity id store."""
+        if self.__candidates is _UNSET:
+            from nordlys.storage.candidates import CandidateTable
+            candidates = None
+            if self.candidates_path:
+                if len(self.entity_ids.uris) == 0:
+                    raise Exception("Candidate table " + self.candidates_path + " needs the entity id store it is "
+                                    "built with (ENTITY_IDS_PATH)")
+                candidates = CandidateTable(self.candidates_path)
+                candidates.check_entity_ids(self.entity_ids)
+            self.__candidates = candidates
+        return self.__candidates
+
+    def version(self):
+        """
+        Returns version of the resources (used for caching annotations); it changes if a resource is configured
+        differently or its files are rebuilt (last modification time of the files).
+        """
+        if self.__version is None:
+            parts = []
+            for path in [self.index_path, self.annot_index_path, self.inlinks_path, self.sf_store,
+                         self.entity_ids_path, self.candidates_path]:
+                mtime = None
+                if path and os.path.isdir(path):
+                    mtime = max([os.path.getmtime(os.path.join(path, fn)) for fn in os.listdir(path)] or [None])
+                parts.append(repr((path, mtime)))
+            parts.append(repr((self.sf_collection, self.use_spotter)))
+            self.__version = md5("\n".join(parts)).hexdigest()
+        return self.__version
+
+    def is_versioned(self):
+        """
+        Returns True if version() changes whenever the data changes. This is not the case for surface forms read from
+        MongoDB, as a collection rebuilt in place keeps its name; results should then not be persisted.
+        """
+        return bool(self.sf_store)
+
+    def num_docs(self):
+        """Returns number of documents with annotations (used for computing relatedness)."""
+        if self.in_links is not None:
+            return self.in_links.num_docs()
+        return self.annot_index.num_docs()
+
+    def open_all(self):
+        """Opens all the resources that are used; e.g., for warming up a long-running service."""
+        self.entity_index
+        self.sf_wiki
+        self.spotter
+        self.entity_ids
+        self.candidates
+        if self.in_links is None:
+            self.annot_index
+
+
+__resources = None
+
+
+def get_resources():
+    """Returns the default resources of the process (created on first use)."""
+    global __resources
+    if __resources is None:
+        __resources = Resources()
+    return __resources
+
+
+def set_resources(resources):
+    """Sets the default resources of the process."""
+    global __resources
+    __resources = resources
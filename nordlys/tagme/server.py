@@ -0,0 +1,127 @@
+"""
+Local TAGME annotation service.
+
+Keeps the indexes, the surface form dictionary and the in-link/relatedness/result caches open between requests.
+The service answers in the format of the TAGME API, so TagmeAPI can be pointed to it:
+
+  python -m nordlys.tagme.server -port 8080
+  python -m nordlys.tagme.tagme_api -data y-erd -uri http://localhost:8080/tag
+
+Request parameters (GET or POST): text, rho_th (default: 0); other TAGME API parameters (key, lang) are ignored.
+With -trace, metrics of the requests are written to a JSON-lines file and summarized at shutdown
+(see nordlys.tagme.metrics).
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import json
+import re
+import time
+import traceback
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from urlparse import urlparse, parse_qs
+from nordlys.tagme import config
+from nordlys.tagme import tagme
+from nordlys.tagme.metrics import Trace
+from nordlys.tagme.query import Query
+from nordlys.tagme.resources import get_resources
+from nordlys.tagme.tagme import Tagme
+from nordlys.wikipedia.utils import WikipediaUtils
+
+
+def annotate(text, rho_th, trace=None):
+    """
+    Annotates the text and returns the response in TAGME API format.
+
+    :param text: text to be annotated
+    :param rho_th: rho score threshold
+    :param trace: if given (Trace object), metrics of the request are added to it
+    :return: {"annotations": [{"spot": .., "title": .., "rho": .., "start": .., "end": ..}, ...], ...}
+    """
+    start_time = time.time()
+    tagme_obj = Tagme(Query(None, text), rho_th, max_cands=config.MAX_CANDIDATES)
+    linked_ens = tagme_obj.annotate()
+
+    annotations = []
+    for men, (en, score) in sorted(linked_ens.iteritems(), key=lambda item: item[1][1], reverse=True):
+        annot = {'spot': men, 'title': WikipediaUtils.wiki_uri_to_title(tagme_obj.get_uri(en)), 'rho': score,
+                 'link_probability': tagme_obj.link_probs[men]}
+        # the mention is found in the original text, ignoring the characters removed by query pre-processing
+        match = re.search(r'[^A-Za-z0-9]+'.join(re.escape(t) for t in men.split()), text, re.IGNORECASE)
+        if match:
+            annot['start'], annot['end'] = match.span()
+        annotations.append(annot)
+    if trace is not None:
+        trace.add(None, tagme_obj.metrics, time.time() - start_time)
+    return {'annotations': annotations, 'lang': "en", 'text': text,
+            'time': int(round((time.time() - start_time) * 1000))}
+
+
+class TagmeHandler(BaseHTTPRequestHandler):
+    """Handles annotation requests: /tag?text=...&rho_th=..."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.__handle(url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        self.__handle(urlparse(self.path).path, parse_qs(self.rfile.read(length)))
+
+    def __handle(self, path, params):
+        if path != "/tag":
+            self.send_error(404, "Unknown endpoint " + path)
+            return
+        if 'text' not in params:
+            self.send_error(400, "Parameter 'text' is missing")
+            return
+        try:
+            rho_th = float(params.get('rho_th', [0])[0])
+        except ValueError:
+            self.send_error(400, "Parameter 'rho_th' should be a number")
+            return
+        try:
+            response = json.dumps(annotate(params['text'][0], rho_th, getattr(self.server, "trace", None)))
+        except Exception as e:
+            traceback.print_exc()
+            self.send_error(500, "Annotation failed: " + repr(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-host", help="Host name", default="localhost")
+    parser.add_argument("-port", help="Port number", type=int, default=8080)
+    parser.add_argument("-trace", help="Writes metrics of the requests to this file (JSON lines)")
+    args = parser.parse_args()
+
+    if config.CACHE_DIR:
+        tagme.load_caches(config.CACHE_DIR)
+    # the resources are opened before the first request
+    get_resources().open_all()
+    server = HTTPServer((args.host, args.port), TagmeHandler)
+    server.trace = Trace(args.trace) if args.trace else None
+    print "TAGME service is running on http://" + args.host + ":" + str(args.port) + "/tag"
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print "in-links cache:", tagme.IN_LINKS_CACHE.stats()
+    print "MW relatedness cache:", tagme.MW_REL_CACHE.stats()
+    print "result cache:", tagme.RESULT_CACHE.stats()
+    if server.trace:
+        server.trace.close()
+        tagme.write_summary(server.trace.records, args.trace)
+    if config.CACHE_DIR:
+        tagme.save_caches(config.CACHE_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Spots the n-grams of a text that are surface forms of the dictionary.
+
+The sorted key table of the surface form dictionary is used as an (implicit) trie: starting from each token,
+the range of keys having the current n-gram as prefix is narrowed down by binary search, while the n-gram is
+extended token by token. The scan stops as soon as no key has the n-gram as prefix; therefore only n-grams
+that exist in the dictionary are emitted, and the number of lookups is about linear in the text length.
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+from bisect import bisect_left
+
+
+class Spotter(object):
+    # end of prefix range; this byte never appears in utf-8 encoded strings
+    MAX_CHAR = "\xff"
+
+    def __init__(self, keys, max_len=6):
+        """
+        :param keys: sorted sequence of (utf-8 encoded) surface forms
+        :param max_len: maximum number of tokens of a spot
+        """
+        self.keys = keys
+        self.max_len = max_len
+
+    def spot(self, tokens):
+        """
+        Finds all n-grams of the token list that are in the dictionary.
+
+        :param tokens: list of tokens
+        :return: list of spots [(start, end, ngram), ...]; the n-gram is tokens[start:end]
+        """
+        spots = []
+        for start in range(len(tokens)):
+            lo, hi = 0, len(self.keys)
+            ngram = None
+            for end in range(start + 1, min(len(tokens), start + self.max_len) + 1):
+                token = tokens[end - 1].encode("utf-8") if isinstance(tokens[end - 1], unicode) else tokens[end - 1]
+                ngram = token if ngram is None else ngram + " " + token
+                # keys having the n-gram as prefix
+                lo = bisect_left(self.keys, ngram, lo, hi)
+                hi = bisect_left(self.keys, ngram + self.MAX_CHAR, lo, hi)
+                if lo == hi:
+                    break
+                if self.keys[lo] == ngram:
+                    spots.append((start, end, ngram))
+        return spots
@@ -5,34 +5,54 @@ TAGME implementation
 """
 
 import argparse
+import json
 import math
+import os
+import subprocess
+import sys
 import time
+from collections import OrderedDict
+import numpy as np
 from nordlys.config import OUTPUT_DIR
 from nordlys.tagme import config
 from nordlys.tagme import test_coll
 from nordlys.tagme.query import Query
 from nordlys.tagme.mention import Mention
+from nordlys.tagme.metrics import Metrics, Trace, read_trace, summarize, print_summary
 from nordlys.tagme.lucene_tools import Lucene
+from nordlys.tagme.resources import get_resources
+from nordlys.storage.cache import LRUCache
 
 
-ENTITY_INDEX = Lucene(config.INDEX_PATH)
-ANNOT_INDEX = Lucene(config.INDEX_ANNOT_PATH, use_ram=True)
-
-# ENTITY_INDEX = IndexCache("/data/wikipedia-indices/20120502-index1")
-# ANNOT_INDEX = IndexCache("/data/wikipedia-indices/20120502-index1-annot/", use_ram=True)
-
-ENTITY_INDEX.open_searcher()
-ANNOT_INDEX.open_searcher()
+# Caches shared by all queries of the process
+# Entities are represented by their integer ids (see nordlys.storage.entity_ids)
+IN_LINKS_CACHE = LRUCache(config.IN_LINKS_CACHE_SIZE)  # {(en_id, ...): in_links, ...}
+MW_REL_CACHE = LRUCache(config.MW_REL_CACHE_SIZE)  # {(en_id1, en_id2): mw_rel, ...}
+# {(query, sf_source, max_cands, resources version): {men: (en_id, rho_score, link_prob), ...}, ...}
+RESULT_CACHE = LRUCache(config.RESULT_CACHE_SIZE)
+# entity id store and version of the resources of saved caches (see load_caches)
+CACHES_VERSION_FILE = "caches.version"
 
 
 class Tagme(object):
 
     DEBUG = 0
 
-    def __init__(self, query, rho_th, sf_source="wiki"):
+    def __init__(self, query, rho_th, sf_source="wiki", resources=None, max_cands=None):
+        """
+        :param query: Query object
+        :param rho_th: rho score threshold
+        :param sf_source: source of surface forms (wiki or facc)
+        :param resources: indexes and dictionaries to be used (Resources object); default resources if None
+        :param max_cands: if set, disambiguation is bounded to the top-N candidates of each mention (see
+            __bound_candidates); the results may differ from TAGME (see report_drift)
+        """
         self.query = query
         self.rho_th = rho_th
         self.sf_source = sf_source
+        self.res = resources if resources is not None else get_resources()
+        self.max_cands = max_cands
+        self.metrics = Metrics()  # wall time of the stages and lookup counters (see nordlys.tagme.metrics)
 
         # TAMGE params
         self.link_prob_th = 0.001
@@ -40,30 +60,68 @@ class Tagme(object):
         self.k_th = 0.3
 
         self.link_probs = {}
-        self.in_links = {}
         self.rel_scores = {}  # dictionary {men: {en: rel_score, ...}, ...}
         self.disamb_ens = {}
+        self.rel_ens = {}  # dictionary {en_id: row/column of rel_matrix, ...}
+        self.rel_matrix = None  # MW relatedness of all candidate entities
+
+    def annotate(self):
+        """
+        Annotates the query: parse, disambiguate and prune.
+        Scores of all disambiguated mentions (before applying the rho threshold) are cached for the normalized
+        query; the same query is then served from the cache with any threshold.
+
+        :return: {men: (en, score), ...}
+        """
+        key = (self.query.query, self.sf_source, self.max_cands, self.res.version())
+        scores = RESULT_CACHE.get(key)
+        if scores is None:
+            self.metrics.count("result_cache_misses")
+            disamb_ens = self.disambiguate(self.parse())
+            with self.metrics.timer("avg_pruning"):
+                rho_scores = self.__get_rho_scores(disamb_ens)
+            scores = {men: (en, rho_score, self.link_probs[men]) for men, (en, rho_score) in rho_scores.iteritems()}
+            RESULT_CACHE.put(key, scores)
+        else:
+            self.metrics.count("result_cache_hits")
+            self.link_probs = {men: link_prob for men, (_, _, link_prob) in scores.iteritems()}
+        return {men: (en, rho_score) for men, (en, rho_score, _) in scores.iteritems() if rho_score >= self.rho_th}
 
     def parse(self):
         """
         Parses the query and returns all candidate mention-entity pairs.
 
-        :return: candidate entities {men:{en:cmn, ...}, ...}
+        :return: candidate entities {men:{en_id:cmn, ...}, ...}
         """
         ens = {}
-        for ngram in self.query.get_ngrams():
-            mention = Mention(ngram)
+        with self.metrics.timer("ngrams"):
+            ngrams = self.query.get_ngrams(spotter=self.res.spotter)
+        self.metrics.count("ngrams", len(ngrams))
+        if self.res.candidates is None:
+            with self.metrics.timer("sf_lookup"):
+                sf_matches = self.res.sf_wiki.get_many(ngrams)  # a single dictionary lookup for all n-grams
+            self.metrics.count("mongo_lookups" if self.res.sf_wiki.store is None else "sf_store_lookups")
+        for ngram in ngrams:
+            with self.metrics.timer("sf_lookup"):
+                if self.res.candidates is not None:  # candidates are read from the precomputed table
+                    mention = Mention(ngram, sf_dict=self.res.sf_wiki, candidates=self.res.candidates)
+                else:
+                    mention = Mention(ngram, sf_matches.get(ngram, {}), sf_dict=self.res.sf_wiki,
+                                      entity_ids=self.res.entity_ids)
+                wiki_occurrences = mention.wiki_occurrences
             # performs mention filtering (based on the paper)
-            if (len(ngram) == 1) or (ngram.isdigit()) or (mention.wiki_occurrences < 2) or (len(ngram.split()) > 6):
+            if (len(ngram) == 1) or (ngram.isdigit()) or (wiki_occurrences < 2) or (len(ngram.split()) > 6):
                 continue
-            link_prob = self.__get_link_prob(mention)
+            with self.metrics.timer("link_prob"):
+                link_prob = self.__get_link_prob(mention)
             if link_prob < self.link_prob_th:
                 continue
             # These mentions will be kept
             self.link_probs[ngram] = link_prob
             # Filters entities by cmn threshold 0.001; this was only in TAGME source code and speeds up the process.
             # TAGME source code: it.acubelab.tagme.anchor (lines 279-284)
-            ens[ngram] = mention.get_men_candidate_ens(0.001)
+            with self.metrics.timer("sf_lookup"):
+                ens[ngram] = mention.get_men_candidate_ens(0.001)
 
         # filters containment mentions (based on paper)
         candidate_entities = {}
@@ -89,41 +147,22 @@ class Tagme(object):
         :param candidate_entities: {men:{en:cmn, ...}, ...}
         :return: disambiguated entities {men:en, ...}
         """
+        if self.max_cands is not None:
+            candidate_entities = self.__bound_candidates(candidate_entities)
+
         # Gets the relevance score
-        # TODO this is the time bottleneck
-        start_get_rel = time.time()
-        rel_scores = {}
-        for m_i in candidate_entities.keys():
-            if self.DEBUG:
-                print "********************", m_i, "********************"
-            rel_scores[m_i] = {}
-            for e_m_i in candidate_entities[m_i].keys():
-                if self.DEBUG:
-                    print "-- ", e_m_i
-                rel_scores[m_i][e_m_i] = 0
-                for m_j in candidate_entities.keys():  # all other mentions
-                    if (m_i == m_j) or (len(candidate_entities[m_j].keys()) == 0):
-                        continue
-                    vote_e_m_j = self.__get_vote(e_m_i, candidate_entities[m_j])
-                    rel_scores[m_i][e_m_i] += vote_e_m_j
-                    if self.DEBUG:
-                        print m_j, vote_e_m_j
-        time_get_rel = time.time() - start_get_rel
+        rel_scores = self.__get_rel_scores(candidate_entities)
 
         # pruning uncommon entities (based on the paper)
-        start_prune_uncommon = time.time()
+        start_dt_prun = time.time()
         self.rel_scores = {}
         for m_i in rel_scores:
-            for e_m_i in rel_scores[m_i]:
-                cmn = candidate_entities[m_i][e_m_i]
-                if cmn >= self.cmn_th:
-                    if m_i not in self.rel_scores:
-                        self.rel_scores[m_i] = {}
-                    self.rel_scores[m_i][e_m_i] = rel_scores[m_i][e_m_i]
-        time_prune_uncommon = time.time() - start_prune_uncommon
+            common_ens = [(e_m_i, rel_score) for e_m_i, rel_score in rel_scores[m_i].iteritems()
+                          if candidate_entities[m_i][e_m_i] >= self.cmn_th]
+            if len(common_ens) > 0:
+                self.rel_scores[m_i] = self.__in_uri_order(common_ens)
 
         # DT pruning
-        start_dt_prun = time.time()
         disamb_ens = {}
         for m_i in self.rel_scores:
             if len(self.rel_scores[m_i].keys()) == 0:
@@ -137,13 +176,38 @@ class Tagme(object):
                     best_en = en
                     best_cmn = cmn
             disamb_ens[m_i] = best_en
-        time_dt_prun = time.time() - start_dt_prun
+        self.metrics.add_time("dt_pruning", time.time() - start_dt_prun)
 
-        print "TIME GET REL: " + str(time_get_rel)
-        print "TIME PRUNE UNCOMMON: " + str(time_prune_uncommon)
-        print "TIME DT PRUNE: " + str(time_dt_prun)
         return disamb_ens
 
+    def __bound_candidates(self, candidate_entities):
+        """
+        Bounded mode: applies the commonness threshold before voting (instead of after it) and keeps the top-N
+        candidates of each mention by commonness. Votes are then computed only over the kept candidates.
+
+        :param candidate_entities: {men:{en:cmn, ...}, ...}
+        :return: {men:{en:cmn, ...}, ...}
+        """
+        bounded_ens = {}
+        for men, men_cand_ens in candidate_entities.iteritems():
+            common_ens = [(en, cmn) for en, cmn in men_cand_ens.iteritems() if cmn >= self.cmn_th]
+            top_ens = sorted(common_ens, key=lambda item: (-item[1], self.get_uri(item[0])))[:self.max_cands]
+            bounded_ens[men] = self.__in_uri_order(top_ens)
+        return bounded_ens
+
+    def __in_uri_order(self, items):
+        """
+        Returns a dictionary of (entity, value) items, ordered as a dictionary keyed by their uris (filled in the
+        same order) would be iterated. Entity ids are then iterated as uris, and ties are broken the same way.
+
+        :param items: list of (en, value) pairs
+        :return: OrderedDict {en: value, ...}
+        """
+        uri_items = {}
+        for en, value in items:
+            uri_items[self.get_uri(en)] = (en, value)
+        return OrderedDict(uri_items.itervalues())
+
     def prune(self, dismab_ens):
         """
         Performs AVG pruning.
@@ -152,21 +216,37 @@ class Tagme(object):
         :return: {men: (en, score), ...}
         """
         linked_ens = {}
-        for men, en in dismab_ens.iteritems():
-            coh_score = self.__get_coherence_score(men, en, dismab_ens)
-            rho_score = (self.link_probs[men] + coh_score) / 2.0
-            if rho_score >= self.rho_th:
-                linked_ens[men] = (en, rho_score)
+        with self.metrics.timer("avg_pruning"):
+            for men, (en, rho_score) in self.__get_rho_scores(dismab_ens).iteritems():
+                if rho_score >= self.rho_th:
+                    linked_ens[men] = (en, rho_score)
         return linked_ens
 
+    def __get_rho_scores(self, dismab_ens):
+        """
+        Computes rho scores of the disambiguated entities.
+
+        :param dismab_ens: {men: en, ... }
+        :return: {men: (en, score), ...}
+        """
+        rho_scores = {}
+        coh_scores = self.__get_coherence_scores(dismab_ens)
+        for men, en in dismab_ens.iteritems():
+            rho_scores[men] = (en, (self.link_probs[men] + coh_scores[men]) / 2.0)
+        return rho_scores
+
     def __get_link_prob(self, mention):
         """
         Gets link probability for the given mention.
         Here, in fact, we are computing key-phraseness.
+        Precomputed link probabilities (see nordlys.wikipedia.link_probs) are used if available.
         """
+        if self.sf_source in mention.link_probs:
+            return mention.link_probs[self.sf_source]
 
-        pq = ENTITY_INDEX.get_phrase_query(mention.text, Lucene.FIELDNAME_CONTENTS)
-        mention_freq = ENTITY_INDEX.searcher.search(pq, 1).totalHits
+        pq = self.res.entity_index.get_phrase_query(mention.text, Lucene.FIELDNAME_CONTENTS)
+        mention_freq = self.res.entity_index.searcher.search(pq, 1).totalHits
+        self.metrics.count("lucene_searches")
         if mention_freq == 0:
             return 0
         if self.sf_source == "wiki":
@@ -177,23 +257,113 @@ class Tagme(object):
             link_prob = mention.facc_occurrences / float(mention_freq)
         return link_prob
 
-    def __get_vote(self, entity, men_cand_ens):
+    def __get_id(self, entity):
+        """Returns id of the entity (entities of facc source are tuples)."""
+        return entity if self.sf_source == "wiki" else entity[0]
+
+    def get_uri(self, entity):
+        """Returns Wikipedia uri of the entity."""
+        return self.res.entity_ids.get_uri(self.__get_id(entity))
+
+    def __get_rel_scores(self, candidate_entities):
         """
+        Computes relevance score of all candidate entities; i.e., sum of votes from all other mentions.
+
         vote_e = sum_e_i(mw_rel(e, e_i) * cmn(e_i)) / i
 
-        :param entity: en
-        :param men_cand_ens: {en: cmn, ...}
-        :return: voting score
+        Votes of a mention are computed for all entities at once, over the columns of the relatedness matrix.
+        Summations follow the order of the entity-by-entity computation, so the scores are exactly the same.
+
+        :param candidate_entities: {men:{en:cmn, ...}, ...}
+        :return: {men: {en: rel_score, ...}, ...}
+        """
+        with self.metrics.timer("relatedness"):
+            self.__set_rel_matrix(candidate_entities)
+        start_voting = time.time()
+        mentions = candidate_entities.keys()
+
+        # votes of each mention for all entities
+        votes = {}
+        for m_j in mentions:
+            men_cand_ens = candidate_entities[m_j]
+            if len(men_cand_ens) == 0:
+                continue
+            vote = np.zeros(len(self.rel_ens))
+            for e_i, cmn in men_cand_ens.iteritems():
+                vote += cmn * self.rel_matrix[:, self.rel_ens[self.__get_id(e_i)]]
+            vote /= float(len(men_cand_ens))
+            votes[m_j] = vote
+
+        rel_scores = {}
+        for m_i in mentions:
+            ens = candidate_entities[m_i].keys()
+            en_pos = [self.rel_ens[self.__get_id(en)] for en in ens]
+            scores = np.zeros(len(ens))
+            for m_j in mentions:  # all other mentions
+                if (m_i == m_j) or (m_j not in votes):
+                    continue
+                scores += votes[m_j][en_pos]
+            rel_scores[m_i] = self.__in_uri_order((en, float(score)) for en, score in zip(ens, scores))
+            if self.DEBUG:
+                print "********************", m_i, "********************"
+                print rel_scores[m_i]
+        self.metrics.add_time("voting", time.time() - start_voting)
+        return rel_scores
+
+    def __set_rel_matrix(self, candidate_entities):
+        """
+        Computes MW relatedness between all candidate entities of the query.
+        Relatedness is only needed (and computed) for entities of different mentions.
+
+        :param candidate_entities: {men:{en:cmn, ...}, ...}
+        """
+        en_ids = sorted({self.__get_id(en) for men_ens in candidate_entities.values() for en in men_ens})
+        self.rel_ens = {en_id: i for i, en_id in enumerate(en_ids)}
+
+        # men_ens[i, j] = 1 if the j-th entity is a candidate of the i-th mention
+        men_ens = np.zeros((len(candidate_entities), len(en_ids)), dtype=int)
+        for i, men_cand_ens in enumerate(candidate_entities.values()):
+            for en in men_cand_ens:
+                men_ens[i, self.rel_ens[self.__get_id(en)]] = 1
+        men_count = men_ens.sum(axis=0)
+        needed = (np.outer(men_count, men_count) - men_ens.T.dot(men_ens)) > 0
+        self.rel_matrix = self.__get_mw_rel_matrix(en_ids, needed)
+
+    def __get_mw_rel_matrix(self, en_ids, needed):
+        """
+        Calculates Milne & Witten relatedness for pairs of entities in one batch; see __get_mw_rel.
+
+        :param en_ids: list of entities
+        :param needed: boolean matrix; relatedness is computed only for the pairs set to True
+        :return: symmetric matrix of relatedness scores
         """
-        entity = entity if self.sf_source == "wiki" else entity[0]
-        vote = 0
-        for e_i, cmn in men_cand_ens.iteritems():
-            e_i = e_i if self.sf_source == "wiki" else e_i[0]
-            mw_rel = self.__get_mw_rel(entity, e_i)
-            # print "\t", e_i, "cmn:", cmn, "mw_rel:", mw_rel
-            vote += cmn * mw_rel
-        vote /= float(len(men_cand_ens))
-        return vote
+        in_links = np.array([self.__get_in_links([en_id]) for en_id in en_ids], dtype=float)
+        conj = np.zeros((len(en_ids), len(en_ids)))
+        cached_rels = {}  # {(i, j): mw_rel, ...}
+        for i, j in zip(*np.nonzero(np.triu(needed, 1))):
+            mw_rel = MW_REL_CACHE.get((en_ids[i], en_ids[j]))
+            self.metrics.count("mw_rel_cache_hits" if mw_rel is not None else "mw_rel_cache_misses")
+            if mw_rel is not None:
+                cached_rels[(i, j)] = mw_rel
+            elif (in_links[i] != 0) and (in_links[j] != 0):
+                conj[i, j] = conj[j, i] = self.__get_in_links([en_ids[i], en_ids[j]])
+
+        max_in_links = np.maximum.outer(in_links, in_links)
+        min_in_links = np.minimum.outer(in_links, in_links)
+        num_docs = self.res.num_docs()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            numerator = np.log(max_in_links) - np.log(conj)
+            denominator = math.log(num_docs) - np.log(min_in_links)
+            rel = 1 - (numerator / denominator)
+            rel[(min_in_links == 0) | (conj == 0) | (rel < 0)] = 0
+        np.fill_diagonal(rel, 1.0)
+
+        for i, j in zip(*np.nonzero(np.triu(needed, 1))):
+            if (i, j) in cached_rels:
+                rel[i, j] = rel[j, i] = cached_rels[(i, j)]
+            else:
+                MW_REL_CACHE.put((en_ids[i], en_ids[j]), float(rel[i, j]))
+        return rel
 
     def __get_mw_rel(self, e1, e2):
         """
@@ -204,51 +374,84 @@ class Tagme(object):
         """
         if e1 == e2:  # to speed-up
             return 1.0
-        en_uris = tuple(sorted({e1, e2}))
-        ens_in_links = [self.__get_in_links([en_uri]) for en_uri in en_uris]
+        en_ids = tuple(sorted({e1, e2}))
+        rel = MW_REL_CACHE.get(en_ids)
+        self.metrics.count("mw_rel_cache_hits" if rel is not None else "mw_rel_cache_misses")
+        if rel is None:
+            rel = self.__calc_mw_rel(en_ids)
+            MW_REL_CACHE.put(en_ids, rel)
+        return rel
+
+    def __calc_mw_rel(self, en_ids):
+        """Calculates Milne & Witten relatedness for a sorted pair of (distinct) entities."""
+        ens_in_links = [self.__get_in_links([en_id]) for en_id in en_ids]
         if min(ens_in_links) == 0:
             return 0
-        conj = self.__get_in_links(en_uris)  # TODO this is redundant, we have already gotten inlinks for each en_uri in en_uris!
+        conj = self.__get_in_links(en_ids)  # TODO this is redundant, we have already gotten inlinks for each en_id in en_ids!
         if conj == 0:
             return 0
         numerator = math.log(max(ens_in_links)) - math.log(conj)
-        denominator = math.log(ANNOT_INDEX.num_docs()) - math.log(min(ens_in_links))
+        num_docs = self.res.num_docs()
+        denominator = math.log(num_docs) - math.log(min(ens_in_links))
         rel = 1 - (numerator / denominator)
         if rel < 0:
             return 0
         return rel
 
-    def __get_in_links(self, en_uris):
+    def __get_in_links(self, en_ids):
         """
         returns "and" occurrences of entities in the corpus.
 
-        :param en_uris: list of dbp_uris
+        :param en_ids: list of entity ids
         """
-        en_uris = tuple(sorted(set(en_uris)))
-        if en_uris in self.in_links:
-            return self.in_links[en_uris]
-
-        term_queries = []
-        for en_uri in en_uris:
-            term_queries.append(ANNOT_INDEX.get_id_lookup_query(en_uri, Lucene.FIELDNAME_CONTENTS))  # term_queries is a list of lucene TermQuery objects
-        and_query = ANNOT_INDEX.get_and_query(term_queries)
-        self.in_links[en_uris] = ANNOT_INDEX.searcher.search(and_query, 1).totalHits
-        return self.in_links[en_uris]
-
-    def __get_coherence_score(self, men, en, dismab_ens):
+        en_ids = tuple(sorted(set(en_ids)))
+        in_links = IN_LINKS_CACHE.get(en_ids)
+        if in_links is not None:
+            self.metrics.count("in_links_cache_hits")
+            return in_links
+        self.metrics.count("in_links_cache_misses")
+
+        # the in-link store and the annotation index are keyed by URIs
+        en_uris = [self.res.entity_ids.get_uri(en_id) for en_id in en_ids]
+        if self.res.in_links is not None:
+            in_links = self.res.in_links.count(en_uris)
+            self.metrics.count("inlink_store_lookups")
+        else:
+            term_queries = []
+            for en_uri in en_uris:
+                term_queries.append(self.res.annot_index.get_id_lookup_query(en_uri, Lucene.FIELDNAME_CONTENTS))  # term_queries is a list of lucene TermQuery objects
+            and_query = self.res.annot_index.get_and_query(term_queries)
+            in_links = self.res.annot_index.searcher.search(and_query, 1).totalHits
+            self.metrics.count("lucene_searches")
+        IN_LINKS_CACHE.put(en_ids, in_links)
+        return in_links
+
+    def __get_coherence_scores(self, dismab_ens):
         """
         coherence_score = sum_e_i(rel(e_i, en)) / len(ens) - 1
 
-        :param en: entity
-        :param dismab_ens: {men:  (dbp_uri, fb_id), ....}
+        Computed for all mentions at once; relatedness scores are taken from the relatedness matrix.
+
+        :param dismab_ens: {men: en, ...}
+        :return: {men: coherence_score, ...}
         """
-        coh_score = 0
-        for m_i, e_i in dismab_ens.iteritems():
-            if m_i == men:
-                continue
-            coh_score += self.__get_mw_rel(e_i, en)
-        coh_score = coh_score / float(len(dismab_ens.keys()) - 1) if len(dismab_ens.keys()) - 1 != 0 else 0
-        return coh_score
+        mentions = dismab_ens.keys()
+        if len(mentions) <= 1:
+            return {men: 0 for men in mentions}
+        en_ids = [self.__get_id(dismab_ens[men]) for men in mentions]
+        if all(en_id in self.rel_ens for en_id in en_ids):
+            en_pos = [self.rel_ens[en_id] for en_id in en_ids]
+            rel = self.rel_matrix[np.ix_(en_pos, en_pos)]
+        else:
+            rel = np.array([[self.__get_mw_rel(e_i, en) for en in en_ids] for e_i in en_ids], dtype=float)
+
+        coh_scores = np.zeros(len(mentions))
+        for i in range(len(mentions)):
+            rel_e_i = rel[i].copy()
+            rel_e_i[i] = 0  # mention itself is not counted
+            coh_scores += rel_e_i
+        coh_scores /= float(len(mentions) - 1)
+        return {men: float(coh_score) for men, coh_score in zip(mentions, coh_scores)}
 
     def __get_top_k(self, mention):
         """Returns top-k percent of the entities based on rel score."""
@@ -268,10 +471,218 @@ class Tagme(object):
         return top_k_ens
 
 
+def caches_version():
+    """
+    Returns version of the resources that the saved caches are computed from (see load_caches): fingerprint of the
+    entity id store (the caches are keyed by entity ids) and version of the resources.
+    """
+    res = get_resources()
+    return [str(v) for v in res.entity_ids.fingerprint()] + [res.version()]
+
+
+def load_caches(cache_dir):
+    """
+    Warm-starts the in-link, relatedness and result caches from a previous run.
+    The caches are not loaded if they are saved for other resources (e.g., rebuilt indexes), as they refer to
+    stale data.
+    """
+    version_file = os.path.join(cache_dir, CACHES_VERSION_FILE)
+    version = open(version_file, "r").read().strip().split("\t") if os.path.exists(version_file) else None
+    if version != caches_version():
+        if os.path.exists(os.path.join(cache_dir, "in_links.cache")):
+            print "Caches in", cache_dir, "are saved for other resources and are not loaded"
+        return
+    # overflow entity ids of the previous run are assigned first, so that the cached ids refer to the same entities
+    overflow_file = os.path.join(cache_dir, "entity_ids.overflow")
+    if os.path.exists(overflow_file):
+        get_resources().entity_ids.load_overflow(overflow_file)
+    IN_LINKS_CACHE.load(os.path.join(cache_dir, "in_links.cache"))
+    MW_REL_CACHE.load(os.path.join(cache_dir, "mw_rel.cache"))
+    # cached results of MongoDB surface forms could be stale (see Resources.is_versioned)
+    if get_resources().is_versioned():
+        RESULT_CACHE.load(os.path.join(cache_dir, "results.cache"))
+
+
+def save_caches(cache_dir):
+    """Saves the in-link, relatedness and result caches to be used in the next run."""
+    version_file = os.path.join(cache_dir, CACHES_VERSION_FILE)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    elif os.path.exists(version_file):
+        os.remove(version_file)  # written when all caches are saved
+    IN_LINKS_CACHE.save(os.path.join(cache_dir, "in_links.cache"))
+    MW_REL_CACHE.save(os.path.join(cache_dir, "mw_rel.cache"))
+    if get_resources().is_versioned():
+        RESULT_CACHE.save(os.path.join(cache_dir, "results.cache"))
+    get_resources().entity_ids.save_overflow(os.path.join(cache_dir, "entity_ids.overflow"))
+    open(version_file, "w").write("\t".join(caches_version()) + "\n")
+
+
+def annotate_queries(queries, threshold, out_file_name, max_cands=None, trace_file_name=None):
+    """
+    Annotates the queries and writes the linked entities to the output file.
+
+    :param queries: list of (qid, query) pairs
+    :param threshold: rho score threshold
+    :param out_file_name: output file
+    :param max_cands: max number of candidates per mention (bounded mode); exact TAGME if None
+    :param trace_file_name: if given, metrics of the queries are written to this file (JSON lines)
+    """
+    open(out_file_name, "w").close()
+    out_file = open(out_file_name, "a")
+    trace = Trace(trace_file_name) if trace_file_name else None
+
+    # process the queries
+    for qid, query in queries:
+        print "[" + qid + "]", query
+        start_time = time.time()
+        tagme = Tagme(Query(qid, query), threshold, max_cands=max_cands)
+        linked_ens = tagme.annotate()
+
+        out_str = ""
+        for men, (en, score) in linked_ens.iteritems():
+            out_str += str(qid) + "\t" + str(score) + "\t" + tagme.get_uri(en) + "\t" + men + "\tpage-id" + "\n"
+        if trace:
+            trace.add(qid, tagme.metrics, time.time() - start_time)
+        print out_str, "-----------\n"
+        out_file.write(out_str)
+    out_file.close()
+
+    print "in-links cache:", IN_LINKS_CACHE.stats()
+    print "MW relatedness cache:", MW_REL_CACHE.stats()
+    print "result cache:", RESULT_CACHE.stats()
+    if trace:
+        trace.close()
+        write_summary(trace.records, trace_file_name)
+
+
+def write_summary(records, trace_file_name):
+    """Prints the metrics summary of the run and writes it next to the trace (.summary.json)."""
+    summary = summarize(records)
+    print_summary(summary)
+    with open(trace_file_name + ".summary.json", "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    print "metrics trace:", trace_file_name
+
+
+def report_drift(queries, threshold, max_cands, out_file_name):
+    """
+    Annotates the queries with both exact and bounded disambiguation, and reports how far the bounded results
+    drift from the exact ones. Differences are written to the output file (qid, mention, exact, bounded).
+
+    :param queries: list of (qid, query) pairs
+    :param threshold: rho score threshold
+    :param max_cands: max number of candidates per mention
+    :param out_file_name: output file
+    """
+    num_same_queries, num_mens, num_same_mens = 0, 0, 0
+    num_cands, num_bounded_cands = 0, 0
+    rho_diffs = []
+    with open(out_file_name, "w") as out_file:
+        for qid, query in queries:
+            print "[" + qid + "]", query
+            exact = Tagme(Query(qid, query), threshold)
+            cand_ens = exact.parse()
+            exact_ens = exact.prune(exact.disambiguate(cand_ens))
+            bounded = Tagme(Query(qid, query), threshold, max_cands=max_cands)
+            bounded.link_probs = exact.link_probs  # parsing is the same in both modes
+            bounded_ens = bounded.prune(bounded.disambiguate(cand_ens))
+
+            num_cands += sum(len(men_ens) for men_ens in cand_ens.values())
+            num_bounded_cands += sum(min(len([cmn for cmn in men_ens.values() if cmn >= bounded.cmn_th]), max_cands)
+                                     for men_ens in cand_ens.values())
+            same_query = True
+            for men in sorted(set(exact_ens) | set(bounded_ens)):
+                num_mens += 1
+                exact_en, exact_rho = exact_ens.get(men, (None, None))
+                bounded_en, bounded_rho = bounded_ens.get(men, (None, None))
+                if exact_en == bounded_en:
+                    num_same_mens += 1
+                    rho_diffs.append(abs(exact_rho - bounded_rho))
+                    continue
+                same_query = False
+                out_file.write(qid + "\t" + men + "\t" +
+                               (exact.get_uri(exact_en) + " " + str(exact_rho) if exact_en is not None else "-") +
+                               "\t" +
+                               (bounded.get_uri(bounded_en) + " " + str(bounded_rho) if bounded_en is not None else "-") +
+                               "\n")
+            if same_query:
+                num_same_queries += 1
+
+    print "=========== Drift of bounded disambiguation (top-" + str(max_cands) + ") ==========="
+    print "queries with the same annotations:", num_same_queries, "/", len(queries)
+    print "mentions linked to the same entity:", num_same_mens, "/", num_mens
+    if len(rho_diffs) > 0:
+        print "rho difference of the same links (mean, max):", np.mean(rho_diffs), np.max(rho_diffs)
+    print "candidates used for voting (exact, bounded):", num_cands, num_bounded_cands
+    print "differences:", out_file_name
+
+
+def annotate_parallel(queries, args, out_file_name):
+    """
+    Annotates the queries using multiple worker processes.
+    Each worker is a separate process (with its own JVM, index searchers and Mongo client) that annotates one shard
+    of the queries; the outputs of the workers are then merged in the qid order.
+
+    :param queries: list of (qid, query) pairs
+    :param args: command line arguments
+    :param out_file_name: output file
+    """
+    workers = []
+    for shard in range(args.workers):
+        shard_file_name = out_file_name + ".shard" + str(shard)
+        cmd = [sys.executable, "-m", "nordlys.tagme.tagme", "-data", args.data, "-th", str(args.threshold),
+               "-workers", str(args.workers), "-shard", str(shard), "-o", shard_file_name]
+        if args.topn is not None:
+            cmd += ["-topn", str(args.topn)]
+        if args.trace:
+            cmd += ["-trace", shard_file_name + ".trace"]
+        log = open(shard_file_name + ".log", "w")
+        workers.append((subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT), shard_file_name, log))
+        print "Worker", shard, "started; log:", log.name
+
+    annots = {}  # {qid: [line, ...], ...}
+    for shard, (worker, shard_file_name, log) in enumerate(workers):
+        if worker.wait() != 0:
+            raise Exception("Worker " + str(shard) + " failed; see " + log.name)
+        log.close()
+        with open(shard_file_name, "r") as shard_file:
+            for line in shard_file:
+                qid = line.split("\t", 1)[0]
+                annots.setdefault(qid, []).append(line)
+        os.remove(shard_file_name)
+
+    with open(out_file_name, "w") as out_file:
+        for qid, _ in queries:
+            out_file.write("".join(annots.get(qid, [])))
+
+    if args.trace:
+        records = []
+        for shard in range(args.workers):
+            shard_trace_file_name = out_file_name + ".shard" + str(shard) + ".trace"
+            records += read_trace(shard_trace_file_name)
+            os.remove(shard_trace_file_name)
+            os.remove(shard_trace_file_name + ".summary.json")
+        order = {qid: i for i, (qid, _) in enumerate(queries)}
+        records.sort(key=lambda record: order[record["qid"]])
+        with open(args.trace, "w") as trace_file:
+            for record in records:
+                trace_file.write(json.dumps(record) + "\n")
+        write_summary(records, args.trace)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-th", "--threshold", help="score threshold", type=float, default=0)
     parser.add_argument("-data", help="Data set name", choices=['y-erd', 'erd-dev', 'wiki-annot30', 'wiki-disamb30'])
+    parser.add_argument("-workers", "--workers", help="Number of worker processes", type=int, default=1)
+    parser.add_argument("-shard", help="Annotates only this shard of the queries (set by the parallel runner)", type=int)
+    parser.add_argument("-topn", help="Bounded disambiguation: max number of candidates per mention", type=int,
+                        default=config.MAX_CANDIDATES)
+    parser.add_argument("-drift", help="Reports drift of bounded disambiguation (-topn) from exact TAGME",
+                        action="store_true", default=False)
+    parser.add_argument("-trace", help="Writes metrics of the queries to this file (JSON lines)")
+    parser.add_argument("-o", "--output", help="Output file")
     args = parser.parse_args()
 
     if args.data == "erd-dev":
@@ -282,30 +693,32 @@ def main():
         queries = test_coll.read_tagme_queries(config.WIKI_ANNOT30_SNIPPET)
     elif args.data == "wiki-disamb30":
         queries = test_coll.read_tagme_queries(config.WIKI_DISAMB30_SNIPPET)
-
-    out_file_name = OUTPUT_DIR + "/" + args.data + "_tagme_wiki10.txt"
-    open(out_file_name, "w").close()
-    out_file = open(out_file_name, "a")
-
-    # process the queries
-    for qid, query in sorted(queries.items(), key=lambda item: int(item[0]) if item[0].isdigit() else item[0]):
-        print "[" + qid + "]", query
-        tagme = Tagme(Query(qid, query), args.threshold)
-        print "  parsing ..."
-        cand_ens = tagme.parse()
-        print "  disambiguation ..."
-        disamb_ens = tagme.disambiguate(cand_ens)
-        print "  pruning ..."
-        linked_ens = tagme.prune(disamb_ens)
-
-        out_str = ""
-        for men, (en, score) in linked_ens.iteritems():
-            out_str += str(qid) + "\t" + str(score) + "\t" + en + "\t" + men + "\tpage-id" + "\n"
-        print out_str, "-----------\n"
-        out_file.write(out_str)
-
+    queries = sorted(queries.items(), key=lambda item: int(item[0]) if item[0].isdigit() else item[0])
+
+    if args.drift:
+        if args.topn is None:
+            parser.error("-drift needs -topn")
+        # the drift report has its own default file, so that it does not overwrite the run file
+        out_file_name = args.output if args.output else \
+            OUTPUT_DIR + "/" + args.data + "_tagme_drift_top" + str(args.topn) + ".txt"
+        report_drift(queries, args.threshold, args.topn, out_file_name)
+        return
+    out_file_name = args.output if args.output else OUTPUT_DIR + "/" + args.data + "_tagme_wiki10.txt"
+    if (args.workers > 1) and (args.shard is None):
+        annotate_parallel(queries, args, out_file_name)
+        print "output:", out_file_name
+        return
+
+    if args.shard is not None:
+        queries = queries[args.shard::args.workers]
+    if config.CACHE_DIR:
+        load_caches(config.CACHE_DIR)
+    annotate_queries(queries, args.threshold, out_file_name, args.topn, args.trace)
+    # the caches of (parallel) workers are not saved, as they would overwrite each other
+    if config.CACHE_DIR and (args.shard is None):
+        save_caches(config.CACHE_DIR)
     print "output:", out_file_name
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -5,9 +5,10 @@ Methods to annotate queries with TagMe API.
 """
 
 import argparse
-import requests
+from itertools import izip
 from nordlys.config import OUTPUT_DIR
 from nordlys.tagme import config
+from nordlys.tagme.api_client import APIClient, Checkpoint
 from nordlys.tagme.test_coll import read_erd_queries, read_yerd_queries, read_tagme_queries
 from nordlys.wikipedia.utils import WikipediaUtils
 
@@ -16,40 +17,46 @@ class TagmeAPI(object):
     TAGME_URI = "http://tagme.di.unipi.it/tag"
     NONE = "*NONE*"
 
-    def __init__(self, key):
+    def __init__(self, key, uri=TAGME_URI, client=None):
+        """
+        :param key: TAGME API key
+        :param uri: annotation endpoint; e.g., a local TAGME service (see nordlys.tagme.server)
+        :param client: APIClient object (concurrency, rate limit and retries); a sequential client if None
+        """
         self.key = key
+        self.uri = uri
+        self.client = client if client is not None else APIClient()
 
     def ask_tagme_query(self, query):
         """Sends queries to Tagme Api."""
         data = {'key': self.key, 'lang': "en", 'text': query}
-        res = requests.post(self.TAGME_URI, data).json()
+        res = self.client.post(self.uri, data)
         res['query'] = query
         return res
 
-    def aks_tagme_queries(self, queries, out_file):
+    def aks_tagme_queries(self, queries, out_file, resume=False):
         """
         Sends queries to Tagme Api and writes them in a json file.
+        The output of each query is written as soon as it is received (see Checkpoint).
 
         :param queries: dictionary {qid: query, ...}
         :param out_file: The file to write the output
+        :param resume: if True, continues a previous (interrupted) run
         """
         print "Getting results from Tagme ..."
-        out_str = ""
-        open(out_file, "w").close()
-        out = open(out_file, "a")
+        out = Checkpoint(out_file, resume)
         i = 0
-        for qid in sorted(queries):
-            query = queries[qid]
-            print "[" + qid + "]", query
-            tagme_res = self.ask_tagme_query(query)
-            out_str += self.__to_str(qid, tagme_res)
-            # responses[qid] = tagme_res
+        qids = [qid for qid in sorted(queries) if qid not in out.done]
+        # queries are sent concurrently, and the responses are written in the qid order
+        responses = self.client.imap(self.ask_tagme_query, [queries[qid] for qid in qids])
+        for qid, tagme_res in izip(qids, responses):
+            print "[" + qid + "]", queries[qid]
+            out.write(qid, self.__to_str(qid, tagme_res))
             i += 1
             if i % 1000 == 0:
-                out.write(out_str)
                 print "until qid:", qid
-                out_str = ""
-        out.write(out_str)
+        out.close()
+        print "requests:", self.client.stats()
         print "TagMe results: " + out_file
 
     def __to_str(self, qid, response):
@@ -76,6 +83,13 @@ def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("-data", help="Data set name", choices=['y-erd', 'erd-dev', 'wiki-annot30', 'wiki-disamb30'])
+    parser.add_argument("-uri", help="TAGME annotation endpoint", default=TagmeAPI.TAGME_URI)
+    parser.add_argument("-workers", help="Number of concurrent requests", type=int, default=1)
+    parser.add_argument("-rate", help="Max number of requests per second", type=float)
+    parser.add_argument("-retries", help="Max number of retries of a failed request", type=int, default=5)
+    parser.add_argument("-cachedir", help="Directory of the response cache (responses are reused by next runs)")
+    parser.add_argument("-resume", help="Continues the previous run from its checkpoint", action="store_true",
+                        default=False)
     args = parser.parse_args()
 
     if args.data == "erd-dev":
@@ -89,8 +103,9 @@ def main():
 
     # Asks TAGME and creates json file
     out_file = OUTPUT_DIR + "/" + args.data + "_tagmeAPI" + ".txt"
-    tagme = TagmeAPI(key)
-    tagme.aks_tagme_queries(queries, out_file)
+    client = APIClient(args.workers, args.rate, args.retries, cache_dir=args.cachedir)
+    tagme = TagmeAPI(key, uri=args.uri, client=client)
+    tagme.aks_tagme_queries(queries, out_file, args.resume)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
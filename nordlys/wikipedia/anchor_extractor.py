@@ -1,10 +1,20 @@
 """
 Creates a single anchor file for all entity-linking annotations.
 
+Anchors can be counted in memory (default), or out-of-core using -partitions N: anchor-entity pairs are
+hash-partitioned by surface form into N files, each partition is counted (in parallel, by -workers processes)
+with sorted spill files when its counts exceed the memory budget, and the sorted partitions are merged into the
+output file. The output of the out-of-core mode is sorted by surface form and entity.
+
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 import argparse
+import heapq
 import os
+import shutil
+import tempfile
+import zlib
+from multiprocessing import Pool
 
 
 def merge_anchors(basedir, outfile):
@@ -16,52 +26,161 @@ def merge_anchors(basedir, outfile):
         for fn in sorted(files):
             if fn.endswith(".tsv"):
                 with open(os.path.join(path, fn)) as in_file:
-                    out.write(in_file.read())
+                    shutil.copyfileobj(in_file, out)
             i += 1
             if i % 100 == 0:
                 print i, "th file is added!"
                 print "file:", os.path.join(path, fn)
 
 
-def count_anchors(anchor_file, out_file):
-    """Counts the number of occurrences anchor-entity pairs"""
-    sf_dict = {}
+def parse_anchor(line):
+    """Returns (surface form, entity) of an annotation line; None if the line is not counted."""
+    cols = line.strip().split("\t")
+    if (len(cols) < 4) or (cols[2].strip().lower() == ""):
+        return None
+    return cols[2].strip().lower(), cols[3].strip()
+
+
+def read_anchors(anchor_file):
+    """Generates (surface form, entity) pairs of the anchor file."""
     in_file = open(anchor_file)
     i = 0
     for line in in_file:
         i += 1
-        cols = line.strip().split("\t")
-        if (len(cols) < 4) or (cols[2].strip().lower() == ""):
-            continue
-        sf = cols[2].strip().lower()
-        en = cols[3].strip()
+        if i % 1000000 == 0:
+            print i, "th line processed!"
+        anchor = parse_anchor(line)
+        if anchor is not None:
+            yield anchor
+    in_file.close()
+
+
+def count_anchors(anchor_file, out_file):
+    """Counts the number of occurrences anchor-entity pairs"""
+    sf_dict = {}
+    for sf, en in read_anchors(anchor_file):
         if sf not in sf_dict:
             sf_dict[sf] = {}
         if en not in sf_dict[sf]:
             sf_dict[sf][en] = 1
         else:
             sf_dict[sf][en] += 1
-        if i % 1000000 == 0:
-            print i, "th line processed!"
 
-    out_str = ""
+    out = open(out_file, "w")
     for sf, en_counts in sf_dict.iteritems():
         for en, count in en_counts.iteritems():
-            out_str += sf + "\t" + en + "\t" + str(count) + "\n"
+            out.write(sf + "\t" + en + "\t" + str(count) + "\n")
+    out.close()
+
+
+def read_counts(count_file):
+    """Generates (surface form, entity, count) triples of a count file."""
+    with open(count_file, "r") as in_file:
+        for line in in_file:
+            sf, en, count = line.rstrip("\n").split("\t")
+            yield sf, en, int(count)
+
+
+def write_counts(counts, out_file):
+    """
+    Writes (surface form, entity, count) triples; consecutive triples of the same pair are summed up.
+
+    :param counts: triples sorted by surface form and entity
+    :param out_file: output file
+    """
     out = open(out_file, "w")
-    out.write(out_str)
+    last_sf, last_en, total = None, None, 0
+    for sf, en, count in counts:
+        if (sf == last_sf) and (en == last_en):
+            total += count
+            continue
+        if last_sf is not None:
+            out.write(last_sf + "\t" + last_en + "\t" + str(total) + "\n")
+        last_sf, last_en, total = sf, en, count
+    if last_sf is not None:
+        out.write(last_sf + "\t" + last_en + "\t" + str(total) + "\n")
     out.close()
 
 
+def count_partition(params):
+    """
+    Counts the anchor-entity pairs of a partition and writes them (sorted) to partition_file + ".count".
+    If the number of counted pairs exceeds max_pairs, the counts are spilled to a sorted run file; the runs are
+    merged at the end.
+
+    :param params: (partition_file, max_pairs)
+    """
+    partition_file, max_pairs = params
+    runs = []
+    counts = {}
+    with open(partition_file, "r") as in_file:
+        for line in in_file:
+            pair = tuple(line.rstrip("\n").split("\t"))
+            counts[pair] = counts.get(pair, 0) + 1
+            if len(counts) >= max_pairs:
+                runs.append(partition_file + ".run" + str(len(runs)))
+                write_counts(((sf, en, c) for (sf, en), c in sorted(counts.iteritems())), runs[-1])
+                counts = {}
+    os.remove(partition_file)
+
+    sorted_counts = ((sf, en, c) for (sf, en), c in sorted(counts.iteritems()))
+    del counts
+    write_counts(heapq.merge(sorted_counts, *[read_counts(run) for run in runs]), partition_file + ".count")
+    for run in runs:
+        os.remove(run)
+    return partition_file + ".count"
+
+
+def count_anchors_external(anchor_file, out_file, num_partitions, workers=1, max_pairs=10000000):
+    """
+    Counts the number of occurrences anchor-entity pairs, using bounded memory.
+
+    :param anchor_file: anchor file (output of merge_anchors)
+    :param out_file: output file, sorted by surface form and entity
+    :param num_partitions: number of partitions
+    :param workers: number of processes counting the partitions
+    :param max_pairs: max number of pairs counted in memory by each process
+    """
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(out_file)))
+    partition_files = [os.path.join(tmp_dir, "part" + str(p)) for p in range(num_partitions)]
+    partitions = [open(fn, "w") for fn in partition_files]
+    for sf, en in read_anchors(anchor_file):
+        partitions[zlib.crc32(sf) % num_partitions].write(sf + "\t" + en + "\n")
+    for partition in partitions:
+        partition.close()
+
+    print "Counting", num_partitions, "partitions ..."
+    params = [(fn, max_pairs) for fn in partition_files]
+    if workers > 1:
+        pool = Pool(workers)
+        count_files = pool.map(count_partition, params, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        count_files = map(count_partition, params)
+
+    # partitions have disjoint surface forms; merging them keeps the output sorted
+    write_counts(heapq.merge(*[read_counts(fn) for fn in count_files]), out_file)
+    shutil.rmtree(tmp_dir)
+
+
 def main():
     # Builds anchor file
     parser = argparse.ArgumentParser()
     parser.add_argument("-inputdir", help="Path to directory to read from")
     parser.add_argument("-outputdir", help="Path to write the annotations (.tsv files)")
+    parser.add_argument("-partitions", help="Counts anchors out-of-core, using this number of partitions", type=int)
+    parser.add_argument("-workers", help="Number of processes counting the partitions", type=int, default=1)
+    parser.add_argument("-maxpairs", help="Max number of pairs counted in memory by each process", type=int,
+                        default=10000000)
     args = parser.parse_args()
 
     merge_anchors(args.inputdir, args.outputdir + "/anchors.txt")
-    count_anchors(args.outputdir + "/anchors.txt", args.outputdir + "/anchors_count.txt")
+    if args.partitions:
+        count_anchors_external(args.outputdir + "/anchors.txt", args.outputdir + "/anchors_count.txt",
+                               args.partitions, args.workers, args.maxpairs)
+    else:
+        count_anchors(args.outputdir + "/anchors.txt", args.outputdir + "/anchors_count.txt")
 
 if __name__ == "__main__":
     main()
@@ -24,18 +24,33 @@ def process_file(wiki_file, out_file):
     :param out_file: Name of tsv file.
     """
     print "Processing " + wiki_file + " ...",
-    open(out_file, "w").close()
-    out = open(out_file, "a")
     f = open(wiki_file, "r")
+    annots = get_annotations(((line, list(tagRE.finditer(line))) for line in f), wiki_file)
+    f.close()
+    out = open(out_file, "w")
+    out.write("".join(annots))
+    out.close()
+    print " --> output in " + out_file
+
+
+def get_annotations(tagged_lines, wiki_file):
+    """
+    Extracts annotations from the lines of an XML annotated file.
+
+    :param tagged_lines: [(line, tag matches), ...]; tag matches are the matches of tagRE in the line
+    :param wiki_file: name of the file (for logging)
+    :return: list of annotation lines "page_id\ttitle\tmention\tlinked_en\n" (of the complete articles)
+    """
     annots = []
+    doc_annots = []
     doc_id, doc_title = None, None
-    for line in f:
-        # Writes annotations and reset variables
+    for line, matches in tagged_lines:
+        # Adds annotations of the article and reset variables
         if re.search(r'</doc>', line):
-            out.write("".join(annots))
-            annots = []
+            annots += doc_annots
+            doc_annots = []
             doc_id, doc_title = None, None
-        for m in tagRE.finditer(line):
+        for m in matches:
             if not m:
                 continue
             tag = m.group(3)
@@ -52,8 +67,8 @@ def process_file(wiki_file, out_file):
                     print "\nINFO: link not found in " + wiki_file,
                     continue
                 annot = doc_id.group(1) + "\t" + doc_title.group(1) + "\t" + mention + "\t" + link.group(1) + "\n"
-                annots.append(annot)
-    print " --> output in " + out_file
+                doc_annots.append(annot)
+    return annots
 
 
 def add_dir(base_in_dir, base_out_dir):
@@ -0,0 +1,158 @@
+"""
+Extracts all resources from the preprocessed Wikipedia dump in a single pass.
+
+Each file of the WikiExtractor output is read (and its tags are matched) once, and the records are sent to all
+the requested outputs:
+  - anchors file: all annotations (same as annot_extractor + anchor_extractor.merge_anchors; input of count_anchors)
+  - page-id-titles file: same as pageid_extractor
+  - full-text index and annotation-only index: same as indexer (without and with -annot)
+
+Usage:
+  python -m nordlys.wikipedia.extractor -inputdir preprocessed-YYYYMMDD/ -anchors path/to/anchors.txt
+    -titles path/to/page-id-titles.txt -index YYYYMMDD-index/ -annotindex YYYYMMDD-index-annot/ -workers 8
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import time
+from itertools import imap
+from multiprocessing import Pool
+from nordlys.tagme.lucene_tools import Lucene
+from nordlys.wikipedia.annot_extractor import get_annotations
+from nordlys.wikipedia.indexer import Indexer
+from nordlys.wikipedia.pageid_extractor import get_page_ids
+
+
+class Extractor(object):
+    PROGRESS_STEP = 10000  # number of documents between two progress reports
+
+    def __init__(self, anchors_file=None, page_ids_file=None, index_dir=None, annot_index_dir=None, checksums=False):
+        """
+        :param anchors_file: output file for annotations
+        :param page_ids_file: output file for page ids and titles
+        :param index_dir: output directory of the full-text index
+        :param annot_index_dir: output directory of the annotation-only index
+        :param checksums: if True, checksums of the articles are added to the page ids file
+        Outputs that are None are not built.
+        """
+        self.anchors_file = anchors_file
+        self.page_ids_file = page_ids_file
+        self.index_dir = index_dir
+        self.annot_index_dir = annot_index_dir
+        self.checksums = checksums
+
+    def extract(self, input_dir, workers=1, ram_buffer_mb=None, merge_policy=None, merge_factor=None):
+        """
+        Extracts all outputs from the files of the input directory.
+
+        :param input_dir: directory of the WikiExtractor output
+        :param workers: number of parser processes
+        :param ram_buffer_mb, merge_policy, merge_factor: settings of the index writers (see Lucene.open_writer)
+        """
+        file_names = Indexer.list_files(input_dir)
+        params = [(fn, self.index_dir is not None, self.annot_index_dir is not None, self.checksums)
+                  for fn in file_names]
+        # worker processes are started before the JVM
+        pool = Pool(workers) if workers > 1 else None
+        results = pool.imap(extract_file, params) if pool else imap(extract_file, params)
+
+        anchors = open(self.anchors_file, "w") if self.anchors_file else None
+        page_ids = open(self.page_ids_file, "w") if self.page_ids_file else None
+        indexers = []  # [(indexer, position of the article field in the extracted articles), ...]
+        if self.index_dir:
+            indexers.append((Indexer(False), 1))
+            indexers[-1][0].lucene = Lucene(self.index_dir)
+        if self.annot_index_dir:
+            indexers.append((Indexer(True), 2))
+            indexers[-1][0].lucene = Lucene(self.annot_index_dir)
+        for indexer, _ in indexers:
+            indexer.lucene.open_writer(ram_buffer_mb, merge_policy, merge_factor)
+
+        start_time = time.time()
+        num_docs, next_report = 0, self.PROGRESS_STEP
+        for i, (file_annots, file_page_ids, articles) in enumerate(results):
+            if anchors:
+                anchors.write(file_annots)
+            if page_ids:
+                page_ids.write(file_page_ids)
+            for article in articles:
+                for indexer, field in indexers:
+                    indexer.lucene.add_document(indexer.get_contents(article[0], article[field]))
+            num_docs += len(articles)
+            if num_docs >= next_report:
+                print "Extracted", num_docs, "documents from", i + 1, "files (" + \
+                      str(int(num_docs / (time.time() - start_time))), "docs/sec)"
+                next_report += self.PROGRESS_STEP
+
+        if pool:
+            pool.close()
+            pool.join()
+        if anchors:
+            anchors.close()
+        if page_ids:
+            page_ids.close()
+        for indexer, _ in indexers:
+            indexer.lucene.close_writer()
+        print "Extracted", num_docs, "documents from", len(file_names), "files (" + \
+              str(int(num_docs / (time.time() - start_time))), "docs/sec)"
+
+
+def extract_file(params):
+    """
+    Extracts the records of a single file; runs in a worker process.
+
+    :param params: (file_name, parse articles for the full-text index, parse articles for the annotation index,
+        add checksums to page ids)
+    :return: (annotations, page ids, [(wiki_uri, article text, annotations), ...])
+    """
+    file_name, text_index, annot_index, checksums = params
+    tagged_lines, index_lines = tag_file(file_name)
+    annots = "".join(get_annotations(tagged_lines, file_name))
+    page_ids = "".join(get_page_ids(tagged_lines, file_name, checksums))
+    articles = []
+    if text_index or annot_index:
+        articles = Indexer(annot_index).parse_lines(index_lines, file_name)
+    return annots, page_ids, articles
+
+
+def tag_file(file_name):
+    """
+    Reads a file and matches the tags of its lines.
+
+    :return: tagged lines [(line, tag matches), ...], and tagged lines for the indexer (without "#redirect")
+    """
+    tagged_lines = []
+    index_lines = []  # tags are matched again only for lines containing "#redirect"
+    with open(file_name, "r") as f:
+        for line in f:
+            matches = list(Indexer.tagRE.finditer(line))
+            tagged_lines.append((line, matches))
+            if "#redirect" in line:
+                line = line.replace("#redirect", "")
+                matches = list(Indexer.tagRE.finditer(line))
+            index_lines.append((line, matches))
+    return tagged_lines, index_lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-inputdir", help="Path to directory to read from")
+    parser.add_argument("-anchors", help="Output file for annotations (e.g., anchors.txt)")
+    parser.add_argument("-titles", help="Output file for page ids and titles (e.g., page-id-titles.txt)")
+    parser.add_argument("-index", help="Output directory of the full-text index")
+    parser.add_argument("-annotindex", help="Output directory of the annotation-only index")
+    parser.add_argument("-checksums", help="Adds checksums of the articles to the page ids file", action="store_true",
+                        default=False)
+    parser.add_argument("-workers", help="Number of parser processes", type=int, default=1)
+    parser.add_argument("-rambuffer", help="RAM buffer size of the index writers (MB)", type=float)
+    parser.add_argument("-mergepolicy", help="Merge policy of the index writers", choices=["tiered", "logbyte"])
+    parser.add_argument("-mergefactor", help="Number of segments merged at once", type=int)
+    args = parser.parse_args()
+
+    extractor = Extractor(args.anchors, args.titles, args.index, args.annotindex, args.checksums)
+    extractor.extract(args.inputdir, args.workers, args.rambuffer, args.mergepolicy, args.mergefactor)
+
+
+if __name__ == "__main__":
+    main()
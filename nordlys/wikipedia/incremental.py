@@ -0,0 +1,292 @@
+"""
+Updates the resources of a previous build to a newer Wikipedia dump, doing work proportional to the changes.
+
+The page-id-titles file of the previous build should have article checksums (pageid_extractor -checksums).
+Pages of the new dump are compared to the previous build by page id and checksum:
+  - deleted and changed pages are removed from the indexes, and their annotations from the anchors file
+  - added and changed pages are (re)indexed, and their annotations are added to the anchors file
+  - anchor counts are adjusted by the removed and added annotations (sorted counts are kept sorted)
+  - surface forms affected by the changes (anchors, titles, and redirects) are written to affected_sfs.txt and,
+    if -collection is given, their documents are replaced in the MongoDB collection (see merge_sf -update)
+
+Files of the previous build (-olddir) and the new build (-outputdir): page-id-titles.txt, anchors.txt,
+anchors_count.txt, and redirects.txt (optional; the new redirects file is given by -redirects).
+Indexes are updated in place. Derived resources (in-link store, surface form store, link probabilities) should be
+rebuilt afterwards.
+
+Usage:
+  python -m nordlys.wikipedia.incremental -inputdir preprocessed-YYYYMMDD/ -olddir path/to/old -outputdir path/to/new
+    -index path/to/index -annotindex path/to/index-annot -redirects path/to/new/redirects.txt -collection surfaceforms
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import zlib
+from urllib import unquote
+import numpy as np
+from nordlys.tagme.lucene_tools import Lucene
+from nordlys.wikipedia.anchor_extractor import parse_anchor, read_counts
+from nordlys.wikipedia.annot_extractor import get_annotations
+from nordlys.wikipedia.extractor import tag_file
+from nordlys.wikipedia.indexer import Indexer
+from nordlys.wikipedia.merge_sf import Merger
+from nordlys.wikipedia.pageid_extractor import read_file
+from nordlys.wikipedia.utils import WikipediaUtils
+
+
+class Updater(object):
+    TITLES_FILE = "page-id-titles.txt"
+    ANCHORS_FILE = "anchors.txt"
+    COUNTS_FILE = "anchors_count.txt"
+    REDIRECTS_FILE = "redirects.txt"
+    AFFECTED_SFS_FILE = "affected_sfs.txt"
+
+    def __init__(self, old_dir, output_dir):
+        self.old_dir = old_dir
+        self.output_dir = output_dir
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.dirty_titles = {}  # {page_id: title} of added and changed pages
+        self.stale_titles = {}  # {page_id: title} of deleted and changed pages (old titles)
+        self.dirty_files = []  # files containing added and changed pages
+
+    def __old(self, file_name):
+        return os.path.join(self.old_dir, file_name)
+
+    def __new(self, file_name):
+        return os.path.join(self.output_dir, file_name)
+
+    @staticmethod
+    def __signature(checksum):
+        return int(checksum[:15], 16)
+
+    def __load_old_pages(self):
+        """Returns page ids (sorted) and checksum signatures of the previous build."""
+        ids, sigs = [], []
+        with open(self.__old(self.TITLES_FILE), "r") as titles:
+            for line in titles:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 3:
+                    raise Exception("Page ids of the previous build have no checksums (use pageid_extractor "
+                                    "-checksums): " + line)
+                ids.append(int(cols[0]))
+                sigs.append(self.__signature(cols[2]))
+        ids, sigs = np.array(ids, dtype=np.int64), np.array(sigs, dtype=np.int64)
+        order = np.argsort(ids, kind="mergesort")
+        return ids[order], sigs[order]
+
+    def find_changes(self, input_dir):
+        """
+        Compares the pages of the new dump to the previous build; writes page ids (with checksums) of the new dump.
+        """
+        print "Finding changed pages ..."
+        old_ids, old_sigs = self.__load_old_pages()
+        new_ids = []
+        with open(self.__new(self.TITLES_FILE), "w") as titles:
+            for file_name in Indexer.list_files(input_dir):
+                page_ids = read_file(file_name, checksums=True)
+                titles.write(page_ids)
+                dirty = False
+                for line in page_ids.splitlines():
+                    page_id, title, checksum = line.split("\t")
+                    new_ids.append(int(page_id))
+                    pos = np.searchsorted(old_ids, int(page_id))
+                    if (pos < len(old_ids)) and (old_ids[pos] == int(page_id)) and \
+                            (old_sigs[pos] == self.__signature(checksum)):
+                        continue
+                    self.dirty_titles[page_id] = title
+                    dirty = True
+                if dirty:
+                    self.dirty_files.append(file_name)
+
+        # deleted pages, and old titles of changed pages
+        stale_ids = set(str(page_id) for page_id in np.setdiff1d(old_ids, np.array(new_ids, dtype=np.int64)))
+        num_deleted = len(stale_ids)
+        stale_ids.update(self.dirty_titles)
+        with open(self.__old(self.TITLES_FILE), "r") as titles:
+            for line in titles:
+                cols = line.rstrip("\n").split("\t")
+                if cols[0] in stale_ids:
+                    self.stale_titles[cols[0]] = cols[1]
+        print len(self.dirty_titles), "pages are added or changed and", num_deleted, "are deleted;", \
+            len(self.dirty_files), "files to be processed."
+
+    def update_indexes(self, index_dirs):
+        """
+        Updates the indexes and returns the annotations of the added and changed pages.
+
+        :param index_dirs: [(index_dir, annot_only), ...]
+        :return: list of annotation lines
+        """
+        indexers = []
+        for index_dir, annot_only in index_dirs:
+            indexer = Indexer(annot_only)
+            indexer.lucene = Lucene(index_dir)
+            indexer.lucene.open_writer(create=False)
+            # deletions are applied only to the documents added before them
+            indexer.lucene.delete_documents(WikipediaUtils.wiki_title_to_uri(title)
+                                            for title in self.stale_titles.itervalues())
+            indexers.append(indexer)
+
+        dirty_uris = set(WikipediaUtils.wiki_title_to_uri(title) for title in self.dirty_titles.itervalues())
+        annots = []
+        for file_name in self.dirty_files:
+            print "Processing " + file_name + " ..."
+            tagged_lines, index_lines = tag_file(file_name)
+            for annot in get_annotations(tagged_lines, file_name):
+                if annot.split("\t", 1)[0] in self.dirty_titles:
+                    annots.append(annot)
+            if len(indexers) == 0:
+                continue
+            for wiki_uri, text, article_annots in Indexer(True).parse_lines(index_lines, file_name):
+                if wiki_uri not in dirty_uris:
+                    continue
+                for indexer in indexers:
+                    indexer.lucene.add_document(indexer.get_contents(wiki_uri,
+                                                                     article_annots if indexer.annot_only else text))
+        for indexer in indexers:
+            indexer.lucene.close_writer()
+        return annots
+
+    def update_anchors(self, annots):
+        """
+        Updates the anchors file and anchor counts.
+
+        :param annots: annotation lines of added and changed pages
+        :return: set of surface forms whose anchor counts are changed
+        """
+        print "Updating anchors ..."
+        deltas = {}  # {(sf, en): count delta}
+        with open(self.__old(self.ANCHORS_FILE), "r") as old_anchors, \
+                open(self.__new(self.ANCHORS_FILE), "w") as new_anchors:
+            for line in old_anchors:
+                if line.split("\t", 1)[0] in self.stale_titles:
+                    anchor = parse_anchor(line)
+                    if anchor is not None:
+                        deltas[anchor] = deltas.get(anchor, 0) - 1
+                else:
+                    new_anchors.write(line)
+            for line in annots:
+                new_anchors.write(line)
+                anchor = parse_anchor(line)
+                if anchor is not None:
+                    deltas[anchor] = deltas.get(anchor, 0) + 1
+
+        changed_sfs = set(sf for (sf, _), delta in deltas.iteritems() if delta != 0)
+
+        # counts of new pairs are merged in order if the old counts are sorted (count_anchors with -partitions, see
+        # merge_sf -anchorssorted); otherwise they are appended to the end
+        pending = sorted(deltas, reverse=True) if self.__is_sorted(self.__old(self.COUNTS_FILE)) else []
+        with open(self.__old(self.COUNTS_FILE), "r") as old_counts, \
+                open(self.__new(self.COUNTS_FILE), "w") as new_counts:
+            for line in old_counts:
+                sf, en, count = line.rstrip("\n").split("\t")
+                # pairs before the current one are not in the old counts (or are already updated)
+                while pending and (pending[-1] < (sf, en)):
+                    new_sf, new_en = pending.pop()
+                    delta = deltas.pop((new_sf, new_en), 0)
+                    if delta > 0:
+                        new_counts.write(new_sf + "\t" + new_en + "\t" + str(delta) + "\n")
+                delta = deltas.pop((sf, en), None)
+                if delta is None:
+                    new_counts.write(line)
+                elif int(count) + delta > 0:
+                    new_counts.write(sf + "\t" + en + "\t" + str(int(count) + delta) + "\n")
+            for (sf, en), delta in sorted(deltas.iteritems()):
+                if delta > 0:
+                    new_counts.write(sf + "\t" + en + "\t" + str(delta) + "\n")
+        return changed_sfs
+
+    @staticmethod
+    def __is_sorted(counts_file):
+        """Returns True if the anchor counts are sorted by surface form and entity."""
+        last_pair = None
+        for sf, en, _ in read_counts(counts_file):
+            if (last_pair is not None) and ((sf, en) < last_pair):
+                return False
+            last_pair = (sf, en)
+        return True
+
+    @staticmethod
+    def __title_sfs(title):
+        """Surface forms of a page title (same as Merger.read_titles)."""
+        title = unquote(title.strip())
+        sfs = {title.lower()}
+        title_nv = Merger.title_nv(title)
+        if (title_nv != title) and (title_nv.strip() != ""):
+            sfs.add(title_nv.lower())
+        return sfs
+
+    def get_redirect_sfs(self, redirects_file, num_partitions=64):
+        """
+        Returns surface forms of the redirects that are added or removed in the new redirects file.
+        Both redirect files are hash-partitioned, and each partition is compared in memory.
+        """
+        print "Comparing redirects ..."
+        work_dir = tempfile.mkdtemp(dir=self.output_dir)
+        partitions = {}
+        for name, file_name in [("old", self.__old(self.REDIRECTS_FILE)), ("new", redirects_file)]:
+            partitions[name] = [os.path.join(work_dir, name + str(p)) for p in range(num_partitions)]
+            outs = [open(fn, "w") for fn in partitions[name]]
+            with open(file_name, "r") as redirects:
+                for line in redirects:
+                    outs[zlib.crc32(line) % num_partitions].write(line)
+            for out in outs:
+                out.close()
+        sfs = set()
+        for old_file, new_file in zip(partitions["old"], partitions["new"]):
+            with open(old_file, "r") as old, open(new_file, "r") as new:
+                for line in set(old) ^ set(new):
+                    sfs.add(line.strip().split("\t")[0].strip().lower())
+        shutil.rmtree(work_dir)
+        return sfs
+
+    def update(self, input_dir, index_dir=None, annot_index_dir=None, redirects_file=None, collection=None):
+        """Updates all resources."""
+        self.find_changes(input_dir)
+        index_dirs = [(d, annot_only) for d, annot_only in [(index_dir, False), (annot_index_dir, True)] if d]
+        annots = self.update_indexes(index_dirs)
+        affected_sfs = self.update_anchors(annots)
+        for title in self.stale_titles.values() + self.dirty_titles.values():
+            affected_sfs.update(self.__title_sfs(title))
+        if redirects_file:
+            if os.path.exists(self.__old(self.REDIRECTS_FILE)):
+                affected_sfs.update(self.get_redirect_sfs(redirects_file))
+            shutil.copyfile(redirects_file, self.__new(self.REDIRECTS_FILE))
+        else:
+            redirects_file = self.__old(self.REDIRECTS_FILE)
+
+        with open(self.__new(self.AFFECTED_SFS_FILE), "w") as sfs_file:
+            for sf in sorted(affected_sfs):
+                sfs_file.write(sf + "\n")
+        print len(affected_sfs), "surface forms are affected; see " + self.__new(self.AFFECTED_SFS_FILE)
+
+        if collection:
+            merger = Merger(surface_forms=affected_sfs)
+            merger.add_anchors(self.__new(self.COUNTS_FILE))
+            merger.add_titles(self.__new(self.TITLES_FILE))
+            merger.add_redirects(redirects_file)
+            merger.update_mongo(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-inputdir", help="Path to the preprocessed new dump")
+    parser.add_argument("-olddir", help="Directory of the files of the previous build")
+    parser.add_argument("-outputdir", help="Directory to write the updated files")
+    parser.add_argument("-index", help="Full-text index to be updated")
+    parser.add_argument("-annotindex", help="Annotation-only index to be updated")
+    parser.add_argument("-redirects", help="Redirects file of the new dump")
+    parser.add_argument("-collection", help="MongoDB collection of surface forms to be updated")
+    args = parser.parse_args()
+
+    updater = Updater(args.olddir, args.outputdir)
+    updater.update(args.inputdir, args.index, args.annotindex, args.redirects, args.collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,21 @@ Creates a Lucene index for Wikipedia articles.
 - disambiguation and list pages are ignored.
 - wiki page annotations are ignored and only mentions are kept.
 
+With -workers N, files are parsed by N worker processes, while the parsed documents are added to a single
+IndexWriter by the main process (using -threads writer threads):
+
+  python -m nordlys.wikipedia.indexer -inputdir path/to/extracted/ -outputdir path/to/index -workers 8 -threads 4 -rambuffer 1024
+
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 import argparse
 import os
 import re
+import threading
+import time
+import traceback
+from multiprocessing import Pool
+from Queue import Queue, Full
 from urllib import unquote
 from nordlys.wikipedia.utils import WikipediaUtils
 from nordlys.tagme.lucene_tools import Lucene
@@ -21,67 +31,93 @@ class Indexer(object):
     titleRE = re.compile(r'title="(.*)"')
     linkRE = re.compile(r'href="(.*)"')
 
+    PROGRESS_STEP = 10000  # number of documents between two progress reports
+
     def __init__(self, annot_only):
         self.annot_only = annot_only
-        self.contents = None
         self.lucene = None
 
-    def __add_to_contents(self, field_name, field_value, field_type):
+    def __add_to_contents(self, contents, field_name, field_value, field_type):
         """
         Adds field to document contents.
         Field value can be a list, where each item is added separately (i.e., the field is multi-valued).
         """
         if type(field_value) is list:
             for fv in field_value:
-                self.__add_to_contents(field_name, fv, field_type)
+                self.__add_to_contents(contents, field_name, fv, field_type)
         else:
             if len(field_value) > 0:  # ignore empty fields
-                self.contents.append({'field_name': field_name,
-                                      'field_value': field_value,
-                                      'field_type': field_type})
+                contents.append({'field_name': field_name,
+                                 'field_value': field_value,
+                                 'field_type': field_type})
 
-    def index_file(self, file_name):
+    def get_contents(self, wiki_uri, article):
         """
-        Adds one file to the index.
+        Returns contents of the Lucene document of an article.
 
-        :param file_name: file to be indexed
+        :param wiki_uri: Wikipedia uri of the article
+        :param article: article text, or list of annotations for annot-only index
         """
-        self.contents = []
-        article_text = ""
-        article_annots = []  # for annot-only index
+        contents = []
+        self.__add_to_contents(contents, Lucene.FIELDNAME_ID, wiki_uri, Lucene.FIELDTYPE_ID)
+        if self.annot_only:
+            self.__add_to_contents(contents, Lucene.FIELDNAME_CONTENTS, article, Lucene.FIELDTYPE_ID_TV)
+        else:
+            self.__add_to_contents(contents, Lucene.FIELDNAME_CONTENTS, article, Lucene.FIELDTYPE_TEXT_TVP)
+        return contents
+
+    def parse_file(self, file_name):
+        """
+        Parses one file; does not need Lucene.
 
+        :param file_name: file to be parsed
+        :return: list of articles to be indexed [(wiki_uri, article), ...]; article is the article text, or list of
+            annotations for annot-only index
+        """
         f = open(file_name, "r")
-        for line in f:
-            line = line.replace("#redirect", "")
+        lines = (line.replace("#redirect", "") for line in f)
+        articles = self.parse_lines(((line, list(self.tagRE.finditer(line))) for line in lines), file_name)
+        f.close()
+        return [(wiki_uri, annots if self.annot_only else text) for wiki_uri, text, annots in articles]
+
+    def parse_lines(self, tagged_lines, file_name):
+        """
+        Parses the lines of one file.
+
+        :param tagged_lines: [(line, tag matches), ...]; lines are without "#redirect", and tag matches are the
+            matches of tagRE in the line
+        :param file_name: name of the file (for logging)
+        :return: list of articles to be indexed [(wiki_uri, article text, annotations), ...]; annotations are only
+            extracted for annot-only index
+        """
+        articles = []
+        article_text = []  # parts of the text, joined at the end of the article
+        article_annots = []  # for annot-only index
+
+        for line, tag_iter in tagged_lines:
             # ------ Reaches the end tag for an article ---------
             if re.search(r'</doc>', line):
+                text = "".join(article_text)
                 # ignores null titles
                 if wiki_uri is None:
                     print "\tINFO: Null Wikipedia title!"
                 # ignores disambiguation pages
                 elif (wiki_uri.endswith("(disambiguation)>")) or \
-                        ((len(article_text) < 200) and ("may refer to:" in article_text)):
+                        ((len(text) < 200) and ("may refer to:" in text)):
                     print "\tINFO: disambiguation page " + wiki_uri + " ignored!"
                 # ignores list pages
                 elif (wiki_uri.startswith("<wikipedia:List_of")) or (wiki_uri.startswith("<wikipedia:Table_of")):
                     print "\tINFO: List page " + wiki_uri + " ignored!"
                 # adds the document to the index
                 else:
-                    self.__add_to_contents(Lucene.FIELDNAME_ID, wiki_uri, Lucene.FIELDTYPE_ID)
-                    if self.annot_only:
-                        self.__add_to_contents(Lucene.FIELDNAME_CONTENTS, article_annots, Lucene.FIELDTYPE_ID_TV)
-                    else:
-                        self.__add_to_contents(Lucene.FIELDNAME_CONTENTS, article_text, Lucene.FIELDTYPE_TEXT_TVP)
-                    self.lucene.add_document(self.contents)
-                self.contents = []
-                article_text = ""
+                    articles.append((wiki_uri, text, article_annots))
+                article_text = []
                 article_annots = []
 
             # ------ Process other lines of article ---------
-            tag_iter = list(self.tagRE.finditer(line))
             # adds line to content if there is no annotation
             if len(tag_iter) == 0:
-                article_text += line
+                article_text.append(line)
                 continue
             # A tag is detected in the line
             for t in tag_iter:
@@ -90,7 +126,7 @@ class Indexer(object):
                     doc_title = self.titleRE.search(t.group(2))
                     wiki_uri = WikipediaUtils.wiki_title_to_uri(doc_title.group(1)) if doc_title else None
                 if tag == "a":
-                    article_text += t.group(1) + t.group(4)  # resolves annotations and replace them with mention
+                    article_text.append(t.group(1) + t.group(4))  # resolves annotations and replace them with mention
                     # extracts only annotations
                     if self.annot_only:
                         link_title = self.linkRE.search(t.group(2))
@@ -100,21 +136,121 @@ class Indexer(object):
                         else:
                             print "\nINFO: link to the annotation not found in " + file_name
             last_span = tag_iter[-1].span()
-            article_text += line[last_span[1]:]
-        f.close()
+            article_text.append(line[last_span[1]:])
+        return articles
 
-    def index_files(self, input_dir, output_dir):
-        """Build index for all files."""
-        self.lucene = Lucene(output_dir)
-        self.lucene.open_writer()
+    def index_file(self, file_name):
+        """
+        Adds one file to the index.
+
+        :param file_name: file to be indexed
+        """
+        for wiki_uri, article in self.parse_file(file_name):
+            self.lucene.add_document(self.get_contents(wiki_uri, article))
+
+    @staticmethod
+    def list_files(input_dir):
+        """Returns all files to be indexed, in the indexing order."""
+        file_names = []
         for path, dirs, _ in os.walk(input_dir):
             for dir in sorted(dirs):
                 for _, _, files in os.walk(os.path.join(input_dir, dir)):
                     for fn in sorted(files):
-                        print "Indexing ", os.path.join(input_dir + dir, fn),  "..."
-                        self.index_file(os.path.join(input_dir + dir, fn))
+                        file_names.append(os.path.join(input_dir + dir, fn))
+        return file_names
+
+    def index_files(self, input_dir, output_dir, ram_buffer_mb=None, merge_policy=None, merge_factor=None):
+        """Build index for all files."""
+        self.lucene = Lucene(output_dir)
+        self.lucene.open_writer(ram_buffer_mb, merge_policy, merge_factor)
+        for file_name in self.list_files(input_dir):
+            print "Indexing ", file_name,  "..."
+            self.index_file(file_name)
+        # closes Lucene index
+        self.lucene.close_writer()
+
+    def index_files_parallel(self, input_dir, output_dir, workers, threads=1, ram_buffer_mb=None, merge_policy=None,
+                             merge_factor=None):
+        """
+        Build index for all files, using multiple processes for parsing.
+
+        The worker processes are started before the JVM, as it cannot be shared with forked processes.
+        Files are parsed in parallel, but their documents are added in the same order as index_files(), if a single
+        writer thread is used.
+
+        :param workers: number of parser processes
+        :param threads: number of writer threads (adding documents to the IndexWriter)
+        """
+        file_names = self.list_files(input_dir)
+        pool = Pool(workers)
+        self.lucene = Lucene(output_dir)
+        self.lucene.open_writer(ram_buffer_mb, merge_policy, merge_factor)
+
+        # documents are passed to the writer threads in batches (one batch per file); None stops a thread
+        batches = Queue(maxsize=threads * 4)
+        self.__writer_errors = []
+        writers = []
+        for _ in range(threads):
+            writer = threading.Thread(target=self.__write_batches, args=(batches,))
+            writer.daemon = True  # a failed run does not wait for the other writers
+            writer.start()
+            writers.append(writer)
+
+        start_time = time.time()
+        num_docs, next_report = 0, self.PROGRESS_STEP
+        for i, articles in enumerate(pool.imap(parse_file, [(fn, self.annot_only) for fn in file_names])):
+            self.__put_batch(batches, articles, pool)
+            num_docs += len(articles)
+            if num_docs >= next_report:
+                print "Indexed", num_docs, "documents from", i + 1, "files (" + \
+                      str(int(num_docs / (time.time() - start_time))), "docs/sec)"
+                next_report += self.PROGRESS_STEP
+        pool.close()
+        pool.join()
+        for _ in writers:
+            self.__put_batch(batches, None, pool)
+        for writer in writers:
+            writer.join()
+        if self.__writer_errors:
+            raise Exception("Indexing failed in a writer thread: " + self.__writer_errors[0])
         # closes Lucene index
         self.lucene.close_writer()
+        print "Indexed", num_docs, "documents from", len(file_names), "files (" + \
+              str(int(num_docs / (time.time() - start_time))), "docs/sec)"
+
+    def __put_batch(self, batches, articles, pool):
+        """
+        Passes a batch to the writer threads; waits while the queue is full.
+        The run is aborted if a writer thread has failed (the queue would not be drained anymore).
+        """
+        while True:
+            if self.__writer_errors:
+                pool.terminate()
+                raise Exception("Indexing failed in a writer thread: " + self.__writer_errors[0])
+            try:
+                batches.put(articles, timeout=1)
+                return
+            except Full:
+                continue
+
+    def __write_batches(self, batches):
+        """Adds batches of documents to the index, until None is received; errors are recorded and stop the run."""
+        Lucene.attach_current_thread()
+        try:
+            while True:
+                articles = batches.get()
+                if articles is None:
+                    break
+                for wiki_uri, article in articles:
+                    self.lucene.add_document(self.get_contents(wiki_uri, article))
+        except Exception:
+            self.__writer_errors.append(traceback.format_exc())
+
+
+def parse_file(params):
+    """Parses a file in a worker process; params is (file_name, annot_only)."""
+    file_name, annot_only = params
+    return Indexer(annot_only).parse_file(file_name)
 
 
 def main():
@@ -122,6 +258,11 @@ def main():
     parser.add_argument("-inputdir", help="Path to directory to read from")
     parser.add_argument("-outputdir", help="Path to write the annotations (.tsv files)")
     parser.add_argument("-annot", help="Annotation-only index", action="store_true", default=False)
+    parser.add_argument("-workers", help="Number of parser processes", type=int, default=1)
+    parser.add_argument("-threads", help="Number of writer threads (with -workers)", type=int, default=1)
+    parser.add_argument("-rambuffer", help="RAM buffer size of the index writer (MB)", type=float)
+    parser.add_argument("-mergepolicy", help="Merge policy of the index writer", choices=["tiered", "logbyte"])
+    parser.add_argument("-mergefactor", help="Number of segments merged at once", type=int)
 
     args = parser.parse_args()
 
@@ -129,9 +270,13 @@ def main():
     input_dir = args.inputdir
     print "index dir: " + output_dir
     indexer = Indexer(args.annot)
-    indexer.index_files(input_dir, output_dir)
+    if args.workers > 1:
+        indexer.index_files_parallel(input_dir, output_dir, args.workers, args.threads, args.rambuffer,
+                                     args.mergepolicy, args.mergefactor)
+    else:
+        indexer.index_files(input_dir, output_dir, args.rambuffer, args.mergepolicy, args.mergefactor)
     print "index build" + output_dir
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
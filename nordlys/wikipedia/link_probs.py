@@ -0,0 +1,134 @@
+"""
+Precomputes link probabilities for all surface forms of the dictionary.
+
+The link probability of a surface form is (number of times it is linked) / (number of documents containing it).
+The denominator is computed by a phrase query over the full-text index, which is the same for all queries;
+it is therefore computed once here and stored together with the final link probabilities:
+  - MongoDB: {"link_prob": {"freq": n, "wiki": lp, ("facc": lp)}} is added to each surface form document
+  - Surface form store: written to link_probs.bin (see nordlys.storage.sf_store)
+
+Surface forms that are never looked up by TAGME (see Tagme.parse) are skipped.
+
+Usage:
+  python -m nordlys.wikipedia.link_probs -index path/to/YYYYMMDD-index -collection surfaceforms_wiki_YYYYMMDD
+  python -m nordlys.wikipedia.link_probs -index path/to/YYYYMMDD-index -store path/to/sf_store
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import os
+import numpy as np
+from pymongo import UpdateOne
+from nordlys.config import MONGO_DB, MONGO_HOST
+from nordlys.storage.mongo import Mongo
+from nordlys.storage.sf_store import SurfaceFormStore
+from nordlys.tagme.lucene_tools import Lucene
+from nordlys.tagme.query import Query
+
+
+class LinkProbs(object):
+    MAX_NGRAM_LEN = 6  # longer mentions are ignored by TAGME
+
+    def __init__(self, index_dir):
+        self.index = Lucene(index_dir)
+        self.index.open_searcher()
+
+    @staticmethod
+    def __occurrences(doc, source):
+        """Number of times the surface form is linked, according to the given source."""
+        return sum(doc.get(source, {}).values())
+
+    def is_mention(self, surface_form, doc):
+        """Returns True if the surface form can be a mention (i.e., it is not filtered before link probability)."""
+        if (len(surface_form) == 1) or surface_form.isdigit() or (len(surface_form.split()) > self.MAX_NGRAM_LEN):
+            return False
+        # query n-grams contain only lowercased alphanumeric terms
+        if Query(None, surface_form).query != surface_form:
+            return False
+        return self.__occurrences(doc, "anchor") >= 2
+
+    def get_link_probs(self, surface_form, doc):
+        """
+        Computes link probabilities of a surface form; same as Tagme.__get_link_prob.
+
+        :param surface_form: surface form
+        :param doc: {source: {en: count, ...}, ...}
+        :return: {"freq": n, "wiki": lp, ("facc": lp)}
+        """
+        pq = self.index.get_phrase_query(surface_form, Lucene.FIELDNAME_CONTENTS)
+        mention_freq = self.index.searcher.search(pq, 1).totalHits
+        link_probs = {"freq": mention_freq}
+        sources = {"wiki": "anchor", "facc": "facc"}
+        for sf_source, source in sources.iteritems():
+            if source not in doc:
+                continue
+            if mention_freq == 0:
+                link_probs[sf_source] = 0
+            else:
+                link_probs[sf_source] = self.__occurrences(doc, source) / float(mention_freq)
+        return link_probs
+
+    def add_to_mongo(self, collection, batch_size=1000):
+        """Adds link probabilities to all documents of a surface form collection."""
+        mongo = Mongo(MONGO_HOST, MONGO_DB, collection)
+        updates = []
+        i = 0
+        for mdoc in mongo.collection.find():
+            doc = mongo.get_doc(mdoc)
+            surface_form = doc.pop(Mongo.ID_FIELD)
+            doc.pop(SurfaceFormStore.LINK_PROB_FIELD, None)
+            if not self.is_mention(surface_form, doc):
+                continue
+            link_probs = self.get_link_probs(surface_form, doc)
+            updates.append(UpdateOne({Mongo.ID_FIELD: mdoc[Mongo.ID_FIELD]},
+                                     {"$set": {SurfaceFormStore.LINK_PROB_FIELD: link_probs}}))
+            if len(updates) == batch_size:
+                mongo.collection.bulk_write(updates, ordered=False)
+                updates = []
+            i += 1
+            if i % 100000 == 0:
+                print "Processed", i, "th surface form!"
+        if len(updates) > 0:
+            mongo.collection.bulk_write(updates, ordered=False)
+        print "Link probabilities are added for", i, "surface forms."
+
+    def add_to_store(self, store_dir):
+        """Writes link probabilities of all surface forms of a store."""
+        store = SurfaceFormStore(store_dir)
+        link_probs = np.zeros(len(store), dtype=SurfaceFormStore.LINK_PROB_DTYPE)
+        link_probs["freq"] = -1
+        i = 0
+        for pos in xrange(len(store)):
+            surface_form = store.keys[pos]
+            doc = store.get_doc(pos)
+            doc.pop(SurfaceFormStore.LINK_PROB_FIELD, None)
+            if not self.is_mention(surface_form, doc):
+                continue
+            sf_link_probs = self.get_link_probs(surface_form, doc)
+            link_probs[pos] = (sf_link_probs["freq"], sf_link_probs.get("wiki", 0), sf_link_probs.get("facc", 0))
+            i += 1
+            if i % 100000 == 0:
+                print "Processed", i, "th surface form!"
+        # the old file may be memory-mapped by the store; it is replaced, not overwritten
+        link_probs_file = os.path.join(store_dir, SurfaceFormStore.LINK_PROBS_FILE)
+        link_probs.tofile(link_probs_file + ".tmp")
+        os.rename(link_probs_file + ".tmp", link_probs_file)
+        print "Link probabilities are added for", i, "surface forms."
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-index", help="Path to full-text index")
+    parser.add_argument("-collection", help="MongoDB collection of surface forms")
+    parser.add_argument("-store", help="Path to surface form store")
+    args = parser.parse_args()
+
+    link_probs = LinkProbs(args.index)
+    if args.collection:
+        link_probs.add_to_mongo(args.collection)
+    if args.store:
+        link_probs.add_to_store(args.store)
+
+if __name__ == "__main__":
+    main()
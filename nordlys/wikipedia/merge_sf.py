@@ -4,21 +4,46 @@ which can be directly imported to Mongodb using this command:
 
  mongoimport --db <db_name> --collection surfaceforms_wiki_YYYYMMDD --file <path_to_json_file> --jsonArray
 
+With the -store option, the merged dictionary is also written to a memory-mapped surface form store
+(see nordlys.storage.sf_store).
+
+With the -stream option, the dictionary is not kept in memory: the records of the three sources are sorted by
+surface form (using sorted spill files), merge-joined, and each surface form document is written out as soon as
+it is complete; to newline-delimited json (sf_dict_mongo.jsonl, imported with mongoimport without --jsonArray),
+directly to a MongoDB collection (-collection), and/or to a surface form store (-store).
+If the anchors file is already sorted by surface form (count_anchors with -partitions), use -anchorssorted.
+
+With the -update option, only the surface forms listed in the given file (one per line; e.g., written by
+nordlys.wikipedia.incremental) are merged, and their documents are replaced in (or deleted from) -collection.
+
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 import argparse
 
 import os
+import heapq
 import json
+import marshal
+import shutil
+import tempfile
+from itertools import groupby
+from operator import itemgetter
 from urllib import unquote
+from pymongo import DeleteOne, InsertOne, ReplaceOne
+from nordlys.config import MONGO_DB, MONGO_HOST
 from nordlys.storage.mongo import Mongo
+from nordlys.storage.sf_store import SurfaceFormStoreWriter
 from nordlys.wikipedia.utils import WikipediaUtils
 
 
 class Merger(object):
 
-    def __init__(self):
+    def __init__(self, surface_forms=None):
+        """
+        :param surface_forms: if given, only these surface forms are merged (e.g., for updating a collection)
+        """
         self.all_sfs = {}
+        self.surface_forms = surface_forms
 
     def merge_all(self, titles_file, redirects_file, anchors_file, out_file):
         self.add_anchors(anchors_file)
@@ -41,7 +66,42 @@ class Merger(object):
         print "writing to json file ..."
         json.dump(sf_mongo_entries, open(out_file, "w"), indent=4, sort_keys=True)
 
+    def write_store(self, store_dir):
+        """Writes all surface forms to a surface form store."""
+        print "Writing surface form store ..."
+        writer = SurfaceFormStoreWriter(store_dir)
+        for sf in sorted(self.all_sfs):
+            writer.add(sf, self.all_sfs[sf])
+        writer.close()
+
+    def update_mongo(self, collection, batch_size=1000):
+        """
+        Updates the documents of the merged surface forms in a MongoDB collection; documents of the given surface
+        forms that do not exist anymore are deleted.
+        """
+        mongo = Mongo(MONGO_HOST, MONGO_DB, collection)
+        updates = []
+        num_replaced, num_deleted = 0, 0
+        for sf in sorted(self.surface_forms):
+            if sf in self.all_sfs:
+                mongo_entry = {"_id": Mongo.escape(sf)}
+                for source, en_counts in self.all_sfs[sf].iteritems():
+                    mongo_entry[source] = {Mongo.escape(en): count for en, count in en_counts.iteritems()}
+                updates.append(ReplaceOne({"_id": mongo_entry["_id"]}, mongo_entry, upsert=True))
+                num_replaced += 1
+            else:
+                updates.append(DeleteOne({"_id": Mongo.escape(sf)}))
+                num_deleted += 1
+            if len(updates) == batch_size:
+                mongo.collection.bulk_write(updates, ordered=False)
+                updates = []
+        if len(updates) > 0:
+            mongo.collection.bulk_write(updates, ordered=False)
+        print num_replaced, "surface forms are updated and", num_deleted, "are deleted."
+
     def __add_to_dict(self, sf, pred, en, count=1):
+        if (self.surface_forms is not None) and (sf not in self.surface_forms):
+            return
         if sf not in self.all_sfs:
             self.all_sfs[sf] = {}
         if pred not in self.all_sfs[sf]:
@@ -53,6 +113,12 @@ class Merger(object):
 
     def add_anchors(self, anchor_file):
         print "Adding anchors ..."
+        for sf, pred, wiki_uri, count in self.read_anchors(anchor_file):
+            self.__add_to_dict(sf, pred, wiki_uri, count)
+
+    @staticmethod
+    def read_anchors(anchor_file):
+        """Generates (sf, "anchor", wiki_uri, count) records of the anchor file."""
         i = 0
         infile = open(anchor_file, "r")
         for line in infile:
@@ -61,16 +127,23 @@ class Merger(object):
             sf = cols[0].strip()
             count = int(cols[2])
             wiki_uri = WikipediaUtils.wiki_title_to_uri(unquote(cols[1].strip()))
-            self.__add_to_dict(sf, "anchor", wiki_uri, count)
+            yield sf, "anchor", wiki_uri, count
             i += 1
             if i % 1000000 == 0:
                 print "Processed", i, "th anchor!"
+        infile.close()
 
     # ============== REDIRECTS ==============
 
     def add_redirects(self, redirect_file):
         """Adds redirect pages to the surface form dictionary."""
         print "Adding redirects ..."
+        for sf, pred, wiki_uri, count in self.read_redirects(redirect_file):
+            self.__add_to_dict(sf, pred, wiki_uri, count)
+
+    @staticmethod
+    def read_redirects(redirect_file):
+        """Generates (sf, "redirect", wiki_uri, 1) records of the redirect file."""
         redirects = open(redirect_file, "r")
         count = 0
         for line in redirects:
@@ -78,32 +151,40 @@ class Merger(object):
             sf = cols[0].strip().lower()
             wiki_uri = WikipediaUtils.wiki_title_to_uri(cols[1].strip())
             # print sf, wiki_uri
-            self.__add_to_dict(sf, "redirect", wiki_uri)
+            yield sf, "redirect", wiki_uri, 1
             count += 1
             if count % 1000000 == 0:
                 print "Processed ", count, "th redirects."
+        redirects.close()
 
     # ============== TITLES ==============
 
     def add_titles(self, title_file):
         """Adds titles and title name variants to the surface form dictionary."""
         print "Adding titles ..."
+        for sf, pred, wiki_uri, count in self.read_titles(title_file):
+            self.__add_to_dict(sf, pred, wiki_uri, count)
+
+    @staticmethod
+    def read_titles(title_file):
+        """Generates (sf, "title", wiki_uri, 1) and (sf, "title-nv", wiki_uri, 1) records of the page-title file."""
         redirects = open(title_file, "r")
         count = 0
         for line in redirects:
             cols = line.strip().split("\t")
             title = unquote(cols[1].strip())
             wiki_uri = WikipediaUtils.wiki_title_to_uri(title)
-            self.__add_to_dict(title.lower(), "title", wiki_uri)
-            title_nv = self.__title_nv(title)
+            yield title.lower(), "title", wiki_uri, 1
+            title_nv = Merger.title_nv(title)
             if (title_nv != title) and (title_nv.strip() != ""):
-                self.__add_to_dict(title_nv.lower(), "title-nv", wiki_uri)
+                yield title_nv.lower(), "title-nv", wiki_uri, 1
             count += 1
             if count % 1000000 == 0:
                 print "Processed ", count, "th titles."
+        redirects.close()
 
     @staticmethod
-    def __title_nv(title):
+    def title_nv(title):
         """Removes all letters after "(" and "," from page title."""
         p_pos = title.find("(")
         title_nv = title[:p_pos] if p_pos != -1 else title
@@ -112,18 +193,179 @@ class Merger(object):
         return title_nv.strip()
 
 
+class StreamingMerger(object):
+    """Merges the sources with bounded memory; surface form documents are written in sorted order."""
+
+    def __init__(self, tmp_dir=None, max_records=5000000):
+        """
+        :param tmp_dir: directory for the spill files
+        :param max_records: max number of records sorted in memory
+        """
+        self.tmp_dir = tmp_dir
+        self.max_records = max_records
+
+    def __sort(self, records, work_dir):
+        """Sorts records (tuples), using sorted spill files of at most max_records records."""
+        runs = []
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= self.max_records:
+                runs.append(self.__write_run(sorted(chunk), os.path.join(work_dir, "run" + str(len(runs)))))
+                chunk = []
+        chunk.sort()
+        if len(runs) == 0:
+            return iter(chunk)
+        return heapq.merge(iter(chunk), *[self.__read_run(run) for run in runs])
+
+    @staticmethod
+    def __write_run(records, run_file):
+        with open(run_file, "wb") as run:
+            for record in records:
+                marshal.dump(record, run)
+        return run_file
+
+    @staticmethod
+    def __read_run(run_file):
+        with open(run_file, "rb") as run:
+            while True:
+                try:
+                    yield marshal.load(run)
+                except EOFError:
+                    break
+
+    @staticmethod
+    def __numbered(records):
+        """(sf, pred, en, count) -> (sf, seq, pred, en, count); seq keeps the order of records within a source."""
+        for seq, (sf, pred, en, count) in enumerate(records):
+            yield sf, seq, pred, en, count
+
+    @staticmethod
+    def __check_sorted(records, name):
+        """Generates the records of a source sorted by surface form; raises an exception if a record is out of order."""
+        last_sf = None
+        for record in records:
+            if (last_sf is not None) and (record[0] < last_sf):
+                raise Exception("The " + name + " file is not sorted by surface form: " + repr(record[0]) +
+                                " is after " + repr(last_sf))
+            last_sf = record[0]
+            yield record
+
+    def merge(self, titles_file, redirects_file, anchors_file, anchors_sorted=False):
+        """
+        Merges the sources and generates surface form documents, sorted by surface form.
+        Documents are the same as the ones of Merger (e.g., the last count of an entity is kept).
+
+        :param anchors_sorted: if True, the anchors file is sorted by surface form and is not sorted again; an
+            exception is raised if it is not sorted
+        :return: generator of (sf, {source: {en: count, ...}, ...})
+        """
+        work_dir = tempfile.mkdtemp(dir=self.tmp_dir)
+        try:
+            sources = []
+            for name, records in [("anchors", Merger.read_anchors(anchors_file)),
+                                  ("titles", Merger.read_titles(titles_file)),
+                                  ("redirects", Merger.read_redirects(redirects_file))]:
+                print "Sorting " + name + " ..."
+                if (name == "anchors") and anchors_sorted:
+                    sources.append(self.__check_sorted(self.__numbered(records), name))
+                else:
+                    source_dir = os.path.join(work_dir, name)
+                    os.makedirs(source_dir)
+                    sources.append(self.__sort(self.__numbered(records), source_dir))
+
+            print "Merging ..."
+            for sf, sf_records in groupby(heapq.merge(*sources), key=itemgetter(0)):
+                doc = {}
+                for _, _, pred, en, count in sf_records:
+                    doc.setdefault(pred, {})[en] = count
+                yield sf, doc
+        finally:
+            shutil.rmtree(work_dir)
+
+    def merge_all(self, titles_file, redirects_file, anchors_file, json_file=None, collection=None,
+                  store_dir=None, anchors_sorted=False, batch_size=1000):
+        """
+        Merges the sources and writes the documents to the given outputs.
+
+        :param json_file: newline-delimited json file, in mongo format
+        :param collection: MongoDB collection; documents are inserted with unordered bulk writes
+        :param store_dir: surface form store
+        """
+        json_out = open(json_file, "w") if json_file else None
+        mongo = Mongo(MONGO_HOST, MONGO_DB, collection) if collection else None
+        store = SurfaceFormStoreWriter(store_dir) if store_dir else None
+        inserts = []
+        i = 0
+        for sf, doc in self.merge(titles_file, redirects_file, anchors_file, anchors_sorted):
+            entry = {"_id": Mongo.escape(sf)}
+            entry.update(doc)
+            if json_out:
+                json_out.write(json.dumps(entry, sort_keys=True) + "\n")
+            if mongo:
+                # entity uris are used as keys and should be escaped for MongoDB (unescaped by SurfaceForms)
+                mongo_entry = {"_id": entry["_id"]}
+                for source, en_counts in doc.iteritems():
+                    mongo_entry[source] = {Mongo.escape(en): count for en, count in en_counts.iteritems()}
+                inserts.append(InsertOne(mongo_entry))
+                if len(inserts) == batch_size:
+                    mongo.collection.bulk_write(inserts, ordered=False)
+                    inserts = []
+            if store:
+                store.add(sf, doc)
+            i += 1
+            if i % 1000000 == 0:
+                print "processes", i, "the surface form"
+        if json_out:
+            json_out.close()
+        if mongo and (len(inserts) > 0):
+            mongo.collection.bulk_write(inserts, ordered=False)
+        if store:
+            store.close()
+        print i, "surface forms are written."
+
+
+def read_surface_forms(sf_file):
+    """Reads a file of surface forms (one per line)."""
+    with open(sf_file, "r") as f:
+        return set(line.rstrip("\n") for line in f)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-anchors", help="Path to anchor file")
     parser.add_argument("-redirects", help="Path to redirect file")
     parser.add_argument("-titles", help="Path to page-title file")
     parser.add_argument("-outputdir", help="Path to output directory")
+    parser.add_argument("-store", help="Path to write the surface form store (optional)")
+    parser.add_argument("-stream", help="Streaming merge with bounded memory", action="store_true", default=False)
+    parser.add_argument("-collection", help="MongoDB collection to write to (with -stream)")
+    parser.add_argument("-anchorssorted", help="Anchors file is sorted by surface form (with -stream)",
+                        action="store_true", default=False)
+    parser.add_argument("-tmpdir", help="Directory for temporary files (with -stream)")
+    parser.add_argument("-update", help="File of surface forms to be updated in -collection")
     args = parser.parse_args()
 
+    if args.update:
+        merger = Merger(surface_forms=read_surface_forms(args.update))
+        merger.add_anchors(args.anchors)
+        merger.add_titles(args.titles)
+        merger.add_redirects(args.redirects)
+        merger.update_mongo(args.collection)
+        return
+
+    if args.stream:
+        merger = StreamingMerger(args.tmpdir)
+        json_file = args.outputdir + "/sf_dict_mongo.jsonl" if args.outputdir else None
+        merger.merge_all(args.titles, args.redirects, args.anchors, json_file, args.collection, args.store,
+                         args.anchorssorted)
+        return
 
     # Merges titles, redirects, and anchors
     merger = Merger()
     merger.merge_all(args.titles, args.redirects, args.anchors, args.outputdir + "/sf_dict_mongo.json")
+    if args.store:
+        merger.write_store(args.store)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,14 @@
 """
 Extracts page id and titles from Wikipedia dump and writes them into a single file
 
+With -checksums, a third column is added: the md5 checksum of the article (from its <doc> line to its </doc> line).
+It is used for detecting changed articles between two dumps (see nordlys.wikipedia.incremental).
+
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 
 import argparse
+import hashlib
 import os
 import re
 
@@ -14,13 +18,33 @@ idRE = re.compile(r'id="([0-9]+)"')
 titleRE = re.compile(r'title="(.*)"')
 
 
-def read_file(file_name):
-    """Extracts page ids and titles from a single file."""
-    out_str = ""
+def read_file(file_name, checksums=False):
+    """Extracts page ids and titles (and checksums) from a single file."""
     f = open(file_name, "r")
+    out_str = "".join(get_page_ids(((line, tagRE.finditer(line)) for line in f), file_name, checksums))
+    f.close()
+    return out_str
+
 
-    for line in f:
-        for m in tagRE.finditer(line):
+def get_page_ids(tagged_lines, file_name, checksums=False):
+    """
+    Extracts page ids and titles from the lines of a single file.
+
+    :param tagged_lines: [(line, tag matches), ...]; tag matches are the matches of tagRE in the line
+    :param file_name: name of the file (for logging)
+    :param checksums: if True, checksums of the articles are added; articles without end tag are then ignored
+    :return: list of lines "page_id\ttitle\n" (or "page_id\ttitle\tchecksum\n")
+    """
+    page_ids = []
+    page_id, md5 = None, None
+    for line, matches in tagged_lines:
+        if checksums and (md5 is not None):
+            md5.update(line)
+            if re.search(r'</doc>', line):
+                page_ids.append(page_id + "\t" + md5.hexdigest() + "\n")
+                page_id, md5 = None, None
+            continue
+        for m in matches:
             if not m:
                 continue
             tag = m.group(3)
@@ -30,12 +54,19 @@ def read_file(file_name):
                 if (not doc_id) or (not doc_title):
                     print "\nINFO: doc id or title not found in " + file_name,
                     continue
-                out_str += doc_id.group(1) + "\t" + doc_title.group(1) + "\n"
+                if checksums:
+                    page_id, md5 = doc_id.group(1) + "\t" + doc_title.group(1), hashlib.md5(line)
+                    # single-line article
+                    if re.search(r'</doc>', line):
+                        page_ids.append(page_id + "\t" + md5.hexdigest() + "\n")
+                        page_id, md5 = None, None
+                else:
+                    page_ids.append(doc_id.group(1) + "\t" + doc_title.group(1) + "\n")
                 break
-    return out_str
+    return page_ids
 
 
-def read_files(basedir, output_file):
+def read_files(basedir, output_file, checksums=False):
     """Extracts page id and titles to a single file."""
     open(output_file, "w").close()
     out_file = open(output_file, "a")
@@ -44,7 +75,7 @@ def read_files(basedir, output_file):
             for _, _, files in os.walk(os.path.join(basedir, dir)):
                 for fn in sorted(files):
                     print "parsing ", os.path.join(basedir + dir, fn),  "..."
-                    out_str = read_file(os.path.join(basedir + dir, fn))
+                    out_str = read_file(os.path.join(basedir + dir, fn), checksums)
                     out_file.write(out_str)
 
 
@@ -52,9 +83,10 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-inputdir", help="Path to directory to read from")
     parser.add_argument("-output", help="Path to write the annotations (.tsv files)")
+    parser.add_argument("-checksums", help="Adds checksums of the articles", action="store_true", default=False)
     args = parser.parse_args()
 
-    read_files(args.inputdir, args.output + "/page-id-titles.txt")
+    read_files(args.inputdir, args.output + "/page-id-titles.txt", args.checksums)
     print "All page ids are added"
 
 
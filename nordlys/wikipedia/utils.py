@@ -4,7 +4,7 @@ Wikipedia utils.
 @author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
 """
 
-from urllib import quote
+from urllib import quote, unquote
 
 
 class WikipediaUtils(object):
@@ -23,6 +23,14 @@ class WikipediaUtils(object):
         else:
             return None
 
+    @staticmethod
+    def wiki_uri_to_title(wiki_uri):
+        """Converts wiki_uri to wiki page title; inverse of wiki_title_to_uri."""
+        if wiki_uri and wiki_uri.startswith("<wikipedia:") and wiki_uri.endswith(">"):
+            return unquote(wiki_uri[len("<wikipedia:"):-1]).replace('_', ' ')
+        else:
+            return None
+
     @staticmethod
     def wiki_uri_to_dbp_uri(wiki_uri):
         """Converts Wikipedia uri to DBpedia URI."""
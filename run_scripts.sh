@@ -74,3 +74,22 @@ python -m scripts.evaluator_strict qrels/qrels_erd-dev.txt output/erd-dev_dexter
 python -m nordlys.tagme.dexter_api -data y-erd 
 python -m scripts.to_elq output/y-erd_dexter.txt 0.1
 python -m scripts.evaluator_strict qrels/qrels_y-erd.txt output/y-erd_dexter_0.1.elq
+
+
+
+# ===================
+# Threshold tuning
+# ===================
+
+# TAGME-our(wiki10) - Wiki-Annot30: P/R/F1 for a grid of rho thresholds (single pass over the run file)
+python -m scripts.evaluator_sweep -qrels qrels/qrels_wiki-annot30.txt -run output/wiki-annot30_tagme_wiki10.txt -metric annot -step 0.05
+python -m scripts.evaluator_sweep -qrels qrels/qrels_wiki-annot30.txt -run output/wiki-annot30_tagme_wiki10.txt -metric topics -step 0.05
+
+
+
+# ===================
+# Batch evaluation
+# ===================
+
+# All evaluations above (after generating the output files), in parallel; results are written to a single table
+python -m scripts.evaluator_batch -manifest eval_manifest.txt -workers 4 -out output/eval_results.txt
@@ -0,0 +1,163 @@
+"""
+Runs a batch of evaluations (runs x qrels x metrics) and writes a single table of results.
+
+Jobs are read from a tab-separated manifest file; each line is a job:
+    <qrel_file> <result_file> <metric> [<score threshold>]
+where metric is one of annot, topics, disamb, and strict (see the evaluator_* scripts). Lines starting with "#"
+are ignored. Each qrel file is parsed once (before starting the workers, which share it), and the jobs are
+evaluated by a pool of worker processes.
+
+Usage:
+    python -m scripts.evaluator_batch -manifest <manifest_file> [-workers 4] [-out <table_file>]
+e.g.
+    python -m scripts.evaluator_batch -manifest eval_manifest.txt -workers 4 -out output/eval_results.txt
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+import argparse
+import sys
+import time
+from itertools import imap
+from multiprocessing import Pool
+from StringIO import StringIO
+from scripts.evaluator_annot import EvaluatorAnnot
+from scripts.evaluator_core import parse_file
+from scripts.evaluator_disamb import EvaluatorDisamb
+from scripts.evaluator_strict import Evaluator
+from scripts.evaluator_topics import EvaluatorTopics
+
+METRICS = ["annot", "topics", "disamb", "strict"]
+
+QRELS = {}  # {(qrel_file, split_nulls): (qrels, null_qrels) or parse error, ..}; filled before starting the workers
+
+
+def read_manifest(file_name):
+    """
+    Reads the jobs of a manifest file.
+
+    :return: list of jobs [(qrel_file, result_file, metric, score_th), ...]; score_th is None if not given
+    """
+    jobs = []
+    with open(file_name, "r") as manifest:
+        for i, line in enumerate(manifest):
+            if (line.strip() == "") or line.startswith("#"):
+                continue
+            cols = line.strip().split("\t")
+            if (len(cols) < 3) or (cols[2] not in METRICS):
+                raise Exception("Invalid job in line " + str(i + 1) + " of " + file_name + ": " + line.strip())
+            score_th = float(cols[3]) if len(cols) > 3 else None
+            jobs.append((cols[0], cols[1], cols[2], score_th))
+    return jobs
+
+
+def load_qrels(jobs):
+    """Parses the qrel files of the jobs; each file is parsed once. Errors are kept and reported by the jobs."""
+    for qrel_file, _, metric, _ in jobs:
+        split_nulls = metric != "strict"
+        if (qrel_file, split_nulls) not in QRELS:
+            print "parsing qrel", qrel_file, "..."
+            try:
+                QRELS[(qrel_file, split_nulls)] = parse_file(qrel_file, split_nulls=split_nulls)
+            except IOError as e:
+                print "ERR: qrel file", qrel_file, "cannot be parsed:", e
+                QRELS[(qrel_file, split_nulls)] = e
+
+
+def get_qrels(qrel_file, split_nulls):
+    """Returns the parsed qrels (qrels, null_qrels); raises the error of the qrel file if it cannot be parsed."""
+    qrels = QRELS[(qrel_file, split_nulls)]
+    if isinstance(qrels, Exception):
+        raise qrels
+    return qrels
+
+
+def evaluate_job(job):
+    """
+    Evaluates a single job; runs in a worker process.
+    The output of the evaluator is not printed, as the jobs run concurrently. A failed job does not stop the batch;
+    its error is returned instead of the metrics.
+
+    :param job: (qrel_file, result_file, metric, score_th)
+    :return: (metrics, evaluation time, error); metrics is None if the job failed
+    """
+    qrel_file, res_file, metric, score_th = job
+    start_time = time.time()
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        if metric == "strict":
+            qrels = get_qrels(qrel_file, False)[0]
+            evaluator = Evaluator(qrels, parse_file(res_file, split_nulls=False)[0])
+        else:
+            qrels, null_qrels = get_qrels(qrel_file, True)
+            if metric == "annot":
+                results = parse_file(res_file, split_nulls=False)[0]
+                evaluator = EvaluatorAnnot(qrels, results, score_th or 0, null_qrels=null_qrels)
+            elif metric == "topics":
+                results = parse_file(res_file)[0]
+                evaluator = EvaluatorTopics(qrels, results, null_qrels=null_qrels, score_th=score_th or 0)
+            else:
+                results = parse_file(res_file, split_nulls=False)[0]
+                evaluator = EvaluatorDisamb(qrels, results, null_qrels=null_qrels)
+        metrics, error = evaluator.eval(), None
+    except (Exception, SystemExit) as e:
+        # e.g., a missing file, or an evaluator exiting on invalid input (the reason is the last line of its output)
+        log = sys.stdout.getvalue().strip() if isinstance(e, SystemExit) else ""
+        metrics, error = None, (repr(e) + (" " + log.splitlines()[-1] if log else "")).replace("\t", " ")
+    finally:
+        sys.stdout = stdout
+    return metrics, time.time() - start_time, error
+
+
+def results_to_str(jobs, results):
+    """Returns the table of results; one tab-separated line per job (metrics of failed jobs are "-")."""
+    out_str = "qrels\trun\tmetric\tth\tprec\trec\tf\terror\n"
+    for (qrel_file, res_file, metric, score_th), (metrics, _, error) in zip(jobs, results):
+        th = str(score_th) if score_th is not None else "-"
+        if metrics is None:
+            scores = ["-", "-", "-"]
+        else:
+            scores = [str(round(metrics['prec'], 4)), str(round(metrics['rec'], 4)), str(round(metrics['f'], 4))]
+        out_str += "\t".join([qrel_file, res_file, metric, th] + scores + [error or "-"]) + "\n"
+    return out_str
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-manifest", help="manifest file (qrel_file, result_file, metric, [threshold])", type=str,
+                        required=True)
+    parser.add_argument("-workers", help="number of worker processes", type=int, default=1)
+    parser.add_argument("-out", help="output file (tab-separated table of results)", type=str)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    jobs = read_manifest(args.manifest)
+    load_qrels(jobs)
+    print "evaluating", len(jobs), "jobs ..."
+    # workers are started after parsing the qrels, so they share them
+    pool = Pool(args.workers) if args.workers > 1 else None
+    results = []
+    for i, result in enumerate(pool.imap(evaluate_job, jobs) if pool else imap(evaluate_job, jobs)):
+        results.append(result)
+        if result[2] is None:
+            print "Job", i + 1, "of", len(jobs), "done (" + str(round(result[1], 2)), "sec)"
+        else:
+            print "Job", i + 1, "of", len(jobs), "failed:", result[2]
+    if pool:
+        pool.close()
+        pool.join()
+
+    out_str = results_to_str(jobs, results)
+    print "\n----------------\nEvaluation results:\n" + out_str
+    num_failed = len([error for _, _, error in results if error is not None])
+    if num_failed > 0:
+        print num_failed, "of", len(jobs), "jobs failed"
+    print "Total time:", round(time.time() - start_time, 2), "sec"
+    if args.out:
+        open(args.out, "w").write(out_str)
+        print "Output file:", args.out
+
+
+if __name__ == '__main__':
+    main()
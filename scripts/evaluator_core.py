@@ -0,0 +1,145 @@
+"""
+Evaluation engine shared by the evaluator scripts.
+
+Qrels and results are parsed once and grouped by query; the items of each query are indexed by entity, so that
+matching an item is a hash lookup (entity match) or a scan over the mentions of the same entity (mention match).
+Matches (TP, FP, FN) are counted for all queries at once, and precision and recall are computed over arrays.
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+from __future__ import division
+from collections import defaultdict
+import numpy as np
+
+NULL_ENTITY = "*NONE*"
+
+
+def parse_file(file_name, split_nulls=True):
+    """
+    Parses file and returns the lines of each query.
+
+    :param file_name: Name of file to be parsed
+    :param split_nulls: if True, lines with null entities are separated
+    :return: lists of lines [[qid, score, en_id, mention, ...], ...], and lines with null entities
+    """
+    null_lines = []
+    file_lines = []
+    with open(file_name, "r") as infile:
+        for line in infile:
+            if line.strip() == "":
+                continue
+            cols = line.strip().split("\t")
+            if split_nulls and (cols[2].strip() == NULL_ENTITY):
+                null_lines.append(cols)
+            else:
+                file_lines.append(cols)
+    return file_lines, null_lines
+
+
+def group_by_queries(file_lines, score_th=None, lower_ens=True):
+    """
+    Groups the lines by query id.
+
+    :param file_lines: list of lines [[qid, score, en_id, mention, page_id], ...]
+    :param score_th: lines with lower scores are ignored; no filtering if None
+    :param lower_ens: if True, entities are lowercased
+    :return: {qid: {(men0, en0), (men1, en01), ..}, ..}
+    """
+    grouped_inters = defaultdict(set)
+    for cols in file_lines:
+        if len(cols) > 2:
+            if (score_th is not None) and (float(cols[1]) < score_th):
+                continue
+            grouped_inters[cols[0]].add((cols[3].lower(), cols[2].lower() if lower_ens else cols[2]))
+    return grouped_inters
+
+
+def mention_match(mention1, mention2):
+    """
+    Checks if two mentions matches each other.
+    Matching condition: One of the mentions is sub-string of the other one.
+    """
+    return (mention1 in mention2) or (mention2 in mention1)
+
+
+def rm_null_mentions(results_dict, null_qrels_dict):
+    """
+    Removes mentions that not linked to an entity in the qrel.
+    There are some entities in the qrel with "*NONE*" as id. We remove the related mentions from the result file.
+    Null entities are generated due to the inconsistency between TAGME Wikipedia dump (2009) and our dump (2010).
+
+    :return: new results {qid: {(men, en), ..}, ..}
+    """
+    new_results_dict = defaultdict(set)
+    for qid, items in results_dict.iteritems():
+        null_mentions = {men for men, _ in null_qrels_dict.get(qid, ())}
+        if len(null_mentions) == 0:
+            new_results_dict[qid] = items
+            continue
+        for men, en in items:
+            if not any(mention_match(null_men, men) for null_men in null_mentions):
+                new_results_dict[qid].add((men, en))
+    return new_results_dict
+
+
+class QueryItems(object):
+    """(mention, entity) items of a query, indexed by entity."""
+
+    def __init__(self, items):
+        self.items = items
+        self.mentions = defaultdict(list)  # {en: [men, ...], ...}
+        for men, en in items:
+            self.mentions[en].append(men)
+
+    def match(self, men, en, match_mentions=True):
+        """Returns True if an item has the same entity (and a matching mention, if match_mentions is True)."""
+        if not match_mentions:
+            return en in self.mentions
+        if (men, en) in self.items:
+            return True
+        return any(mention_match(men, m) for m in self.mentions.get(en, ()))
+
+
+def count_matches(qids, qrels_dict, results_dict, match_mentions=True):
+    """
+    Counts matches of qrels and results for the given queries.
+    Each qrel item is a TP if it is matched by a result item, otherwise a FN; a result item is a FP if it is not
+    matched by any qrel item.
+
+    :param qids: list of query ids
+    :param qrels_dict: {qid: {(men, en), ..}, ..}
+    :param results_dict: {qid: {(men, en), ..}, ..}
+    :param match_mentions: if True, entities and mentions should match; otherwise only entities
+    :return: tp, fp, fn arrays (in the order of qids)
+    """
+    tp, fp, fn = np.zeros(len(qids), dtype=int), np.zeros(len(qids), dtype=int), np.zeros(len(qids), dtype=int)
+    for i, qid in enumerate(qids):
+        qrels, results = qrels_dict.get(qid, set()), results_dict.get(qid, set())
+        qrel_items, res_items = QueryItems(qrels), QueryItems(results)
+        tp[i] = sum(1 for men, en in qrels if res_items.match(men, en, match_mentions))
+        fn[i] = len(qrels) - tp[i]
+        fp[i] = sum(1 for men, en in results if not qrel_items.match(men, en, match_mentions))
+    return tp, fp, fn
+
+
+def prec_rec(tp, fp, fn):
+    """Returns precision and recall arrays; 0 if they are undefined."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prec = np.where(tp + fp != 0, tp / (tp + fp), 0.0)
+        rec = np.where(tp + fn != 0, tp / (tp + fn), 0.0)
+    return prec, rec
+
+
+def macro_average(values):
+    """Averages per-query values; summed in the order of the queries (same as summing them one by one)."""
+    return sum(values.tolist()) / len(values)
+
+
+def print_metrics(prec, rec, f):
+    log = "\n----------------" + "\nEvaluation results:\n" + \
+          "Prec: " + str(round(prec, 4)) + "\n" +\
+          "Rec:  " + str(round(rec, 4)) + "\n" + \
+          "F1:   " + str(round(f, 4)) + "\n" + \
+          "all:  " + str(round(prec, 4)) + ", " + str(round(rec, 4)) + ", " + str(round(f, 4))
+    print log
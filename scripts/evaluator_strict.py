@@ -18,6 +18,8 @@ e.g.
 from __future__ import division
 import sys
 from collections import defaultdict
+import numpy as np
+from scripts.evaluator_core import parse_file, prec_rec, macro_average, print_metrics
 
 
 class Evaluator(object):
@@ -56,114 +58,54 @@ class Evaluator(object):
                     q_interprets.add(tuple(sorted(inter)))
         return grouped_inters
 
-    def eval(self, eval_query_func):
+    def eval(self):
         """
         Evaluates all queries and calculates total precision, recall and F1 (macro averaging).
 
-        :param eval_query_func: A function that takes qrel and results for a query and returns evaluation metrics
         :return  Total precision, recall, and F1 for all queries
         """
-        queries_eval = {}
-        total_prec, total_rec, total_f = 0, 0, 0
-        for qid in sorted(self.qrels_dict):
-            queries_eval[qid] = eval_query_func(self.qrels_dict[qid], self.results_dict.get(qid, []))
-            total_prec += queries_eval[qid]['prec']
-            total_rec += queries_eval[qid]['rec']
-        n = len(self.qrels_dict)  # number of queries
-        total_prec /= n
-        total_rec /= n
+        qids = sorted(self.qrels_dict)
+        prec, rec = np.zeros(len(qids)), np.zeros(len(qids))
+        tp, fp, fn = np.zeros(len(qids), dtype=int), np.zeros(len(qids), dtype=int), np.zeros(len(qids), dtype=int)
+        non_empty = np.ones(len(qids), dtype=bool)
+        for i, qid in enumerate(qids):
+            query_qrels, query_results = self.qrels_dict[qid], self.results_dict.get(qid, [])
+            # ----- Query has no interpretation set. ------
+            if len(query_qrels) == 0:
+                non_empty[i] = False
+                prec[i] = rec[i] = 1 if len(query_results) == 0 else 0
+                continue
+            # ----- Query has at least an interpretation set. -----
+            qrel_isets, res_isets = lower_isets(query_qrels), lower_isets(query_results)
+            res_set, qrel_set = set(res_isets), set(qrel_isets)
+            tp[i] = sum(1 for iset in qrel_isets if iset in res_set)
+            fn[i] = len(qrel_isets) - tp[i]
+            fp[i] = sum(1 for iset in res_isets if iset not in qrel_set)
+        q_prec, q_rec = prec_rec(tp, fp, fn)
+        prec = np.where(non_empty, q_prec, prec)
+        rec = np.where(non_empty, q_rec, rec)
+
+        total_prec = macro_average(prec)
+        total_rec = macro_average(rec)
         total_f = (2 * total_rec * total_prec) / (total_rec + total_prec) if total_prec + total_rec != 0 else 0
-
-        log = "\n----------------" + "\nEvaluation results:\n" + \
-              "Prec: " + str(round(total_prec, 4)) + "\n" +\
-              "Rec:  " + str(round(total_rec, 4)) + "\n" + \
-              "F1:   " + str(round(total_f, 4)) + "\n" + \
-              "all:  " + str(round(total_prec, 4)) + ", " + str(round(total_rec, 4)) + ", " + str(round(total_f, 4))
-        print log
+        print_metrics(total_prec, total_rec, total_f)
         metrics = {'prec': total_prec, 'rec': total_rec, 'f': total_f}
         return metrics
 
 
-def erd_eval_query(query_qrels, query_results):
-    """
-    Evaluates a single query.
-
-    :param query_qrels: Query interpretations from Qrel [{en1, en2, ..}, ..]
-    :param query_results: Query interpretations from result file [{en1, en2, ..}, ..]
-    :return: precision, recall, and F1 for a query
-    """
-    tp = 0  # correct
-    fn = 0  # missed
-    fp = 0  # incorrectly returned
-
-    # ----- Query has no interpretation set. ------
-    if len(query_qrels) == 0:
-        if len(query_results) == 0:
-            return {'prec': 1, 'rec': 1, 'f': 1}
-        return {'prec': 0, 'rec': 0, 'f': 0}
-
-    # ----- Query has at least an interpretation set. -----
-    # Iterate over qrels to calculate TP and FN
-    for qrel_item in query_qrels:
-        if find_item(qrel_item, query_results):
-            tp += 1
-        else:
-            fn += 1
-    # Iterate over results to calculate FP
-    for res_item in query_results:
-        if not find_item(res_item, query_qrels):  # Finds the result in the qrels
-            fp += 1
-
-    prec = tp / (tp+fp) if tp+fp != 0 else 0
-    rec = tp / (tp+fn) if tp+fn != 0 else 0
-    metrics = {'prec': prec, 'rec': rec}
-    return metrics
-
-
-def find_item(item_to_find, items_list):
-    """
-    Returns True if an item is found in the item list.
-
-    :param item_to_find: item to be found
-    :param items_list: list of items to search in
-    :return boolean
-    """
-    is_found = False
-
-    item_to_find = set([en.lower() for en in item_to_find])
-
-    for item in items_list:
-        item = set([en.lower() for en in item])
-        if item == item_to_find:
-            is_found = True
-    return is_found
-
-
-def parse_file(file_name):
-    """
-    Parses file and returns the positive instances for each query.
-
-    :param file_name: Name of file to be parsed
-    :return list of lines [[qid, label, en_id, ...], ...]
-    """
-    file_lines = []
-    efile = open(file_name, "r")
-    for line in efile.readlines():
-        if line.strip() == "":
-            continue
-        cols = line.strip().split("\t")
-        file_lines.append(cols)
-    return file_lines
+def lower_isets(isets):
+    """Returns interpretation sets with lowercased entities; an interpretation matches the equal (lowercased) ones."""
+    return [frozenset(en.lower() for en in iset) for iset in isets]
 
 
 def main(args):
     if len(args) < 2:
         print "\tUsage: [qrel_file] [result_file]"
         exit(0)
-    qrels = parse_file(args[0])
-    results = parse_file(args[1])
+    qrels = parse_file(args[0], split_nulls=False)[0]
+    results = parse_file(args[1], split_nulls=False)[0]
     evaluator = Evaluator(qrels, results)
-    evaluator.eval(erd_eval_query)
+    evaluator.eval()
 
 if __name__ == '__main__':
     main(sys.argv[1:])
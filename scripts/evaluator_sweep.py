@@ -0,0 +1,196 @@
+"""
+Evaluates a run file for a grid of score thresholds (e.g., TAGME rho_th) in a single pass.
+
+The files are parsed once and each result item is kept with its highest score. Each qrel item gets the highest
+score of the result items matching it, and each unmatched result item counts as a FP above its score; per-query
+TP, FP and FN for all thresholds are then counted from the sorted scores. The metrics are the same as the ones of
+evaluator_annot (macro-averaged) and evaluator_topics (micro-averaged) run with each threshold.
+By default, thresholds are all distinct scores of the run (exact P/R curve).
+
+Usage:
+    python -m scripts.evaluator_sweep -qrels <qrel_file> -run <result_file> -metric <annot|topics> [-step 0.05]
+e.g.
+    python -m scripts.evaluator_sweep -qrels qrels/qrels_wiki-annot30.txt -run output/wiki-annot30_tagme_wiki10.txt
+        -metric annot -step 0.05 -out output/wiki-annot30_tagme_wiki10.sweep
+
+@author: Faegheh Hasibi (faegheh.hasibi@idi.ntnu.no)
+"""
+
+from __future__ import division
+import argparse
+from collections import defaultdict
+import numpy as np
+from scripts.evaluator_core import parse_file, group_by_queries, rm_null_mentions, mention_match, QueryItems, \
+    prec_rec, macro_average
+
+METRICS = ["annot", "topics"]
+
+
+def group_scores_by_queries(file_lines):
+    """
+    Groups the lines by query id and keeps the highest score of each item.
+
+    :param file_lines: list of lines [[qid, score, en_id, mention, page_id], ...]
+    :return: {qid: {(men0, en0): score0, ..}, ..}
+    """
+    grouped_scores = defaultdict(dict)
+    for cols in file_lines:
+        if len(cols) > 2:
+            item = (cols[3].lower(), cols[2].lower())
+            score = float(cols[1])
+            if score > grouped_scores[cols[0]].get(item, float("-inf")):
+                grouped_scores[cols[0]][item] = score
+    return grouped_scores
+
+
+class ThresholdSweep(object):
+
+    def __init__(self, qrels, results, metric, null_qrels=None):
+        """
+        :param qrels: qrel lines (without null entities)
+        :param results: result lines; lines with null entities are ignored for the topics metric
+        :param metric: annot or topics
+        :param null_qrels: qrel lines with null entities
+        """
+        if metric not in METRICS:
+            raise Exception("Unknown metric: " + metric)
+        self.metric = metric
+        self.qrels_dict = group_by_queries(qrels)
+        self.results_dict = group_scores_by_queries(results)
+        self.null_qrels = group_by_queries(null_qrels) if null_qrels else {}
+        self.__rm_nulls()
+        self.qids = sorted(self.qrels_dict)
+        self.match_scores, self.fp_scores = self.__score_matches()
+
+    def __rm_nulls(self):
+        """Removes result items of null mentions; it does not depend on the threshold."""
+        print "Removing mentions with null entities ..."
+        kept = rm_null_mentions({qid: set(items) for qid, items in self.results_dict.iteritems()}, self.null_qrels)
+        self.results_dict = {qid: {item: score for item, score in self.results_dict[qid].iteritems() if item in items}
+                             for qid, items in kept.iteritems()}
+
+    def __score_matches(self):
+        """
+        Scores matches of each query:
+          - qrel item: highest score of the result items matching it (if any); TP if above the threshold
+          - result item: its score if it does not match any qrel item; FP if above the threshold
+
+        :return: sorted arrays of the scores of qrel items and FP result items, per query
+        """
+        match_mentions = self.metric == "annot"
+        match_scores, fp_scores = [], []
+        for qid in self.qids:
+            qrels, results = self.qrels_dict[qid], self.results_dict.get(qid, {})
+            qrel_items = QueryItems(qrels)
+            res_scores = defaultdict(list)  # {en: [(men, score), ..], ..}
+            for (men, en), score in results.iteritems():
+                res_scores[en].append((men, score))
+            q_match_scores = []
+            for men, en in qrels:
+                matches = [score for res_men, score in res_scores.get(en, ())
+                           if (not match_mentions) or mention_match(men, res_men)]
+                if matches:
+                    q_match_scores.append(max(matches))
+            q_fp_scores = [score for (men, en), score in results.iteritems()
+                           if not qrel_items.match(men, en, match_mentions)]
+            match_scores.append(np.sort(q_match_scores))
+            fp_scores.append(np.sort(q_fp_scores))
+        return match_scores, fp_scores
+
+    def count_matches(self, thresholds):
+        """
+        Counts TP, FP, and FN of all queries for the thresholds.
+
+        :param thresholds: sorted array of thresholds
+        :return: tp, fp, fn arrays of shape (queries, thresholds)
+        """
+        # same as evaluator_topics: a zero threshold does not filter the results
+        if self.metric == "topics":
+            thresholds = np.where(thresholds == 0, float("-inf"), thresholds)
+        shape = (len(self.qids), len(thresholds))
+        tp, fp, fn = np.zeros(shape, dtype=int), np.zeros(shape, dtype=int), np.zeros(shape, dtype=int)
+        for i in xrange(len(self.qids)):
+            # number of scores >= threshold (items with score < threshold are filtered out)
+            m, f = self.match_scores[i], self.fp_scores[i]
+            tp[i] = len(m) - np.searchsorted(m, thresholds, side="left")
+            fp[i] = len(f) - np.searchsorted(f, thresholds, side="left")
+            fn[i] = len(self.qrels_dict[self.qids[i]]) - tp[i]
+        return tp, fp, fn
+
+    def thresholds(self, step=None):
+        """Returns all distinct scores of the results, or a grid of thresholds between 0 and the max score."""
+        scores = [score for items in self.results_dict.itervalues() for score in items.itervalues()]
+        if len(scores) == 0:
+            return np.array([0.0])
+        if step is None:
+            return np.unique([0.0] + scores)
+        # multiples of the step are rounded, so that they are the same as thresholds given as numbers (e.g., 0.15)
+        num_steps = int(np.ceil(round(max(scores) / step, 10)))
+        return np.round(np.arange(num_steps + 1) * step, 10)
+
+    def eval(self, thresholds):
+        """
+        Evaluates the run for the thresholds.
+
+        :param thresholds: list of thresholds
+        :return: list of metrics [{'th': .., 'prec': .., 'rec': .., 'f': ..}, ..]
+        """
+        thresholds = np.sort(np.asarray(thresholds, dtype=float))
+        tp, fp, fn = self.count_matches(thresholds)
+        if self.metric == "annot":  # macro averaging
+            prec, rec = prec_rec(tp, fp, fn)
+            total_precs = [macro_average(prec[:, j]) for j in xrange(len(thresholds))]
+            total_recs = [macro_average(rec[:, j]) for j in xrange(len(thresholds))]
+        else:  # micro averaging
+            total_tp, total_fp, total_fn = tp.sum(axis=0), fp.sum(axis=0), fn.sum(axis=0)
+            total_precs, total_recs = prec_rec(total_tp, total_fp, total_fn)
+        curve = []
+        for th, total_prec, total_rec in zip(thresholds.tolist(), list(total_precs), list(total_recs)):
+            total_f = 2 * total_prec * total_rec / (total_prec + total_rec) if total_prec + total_rec != 0 else 0
+            curve.append({'th': th, 'prec': float(total_prec), 'rec': float(total_rec), 'f': float(total_f)})
+        return curve
+
+
+def best_threshold(curve):
+    """Returns metrics of the threshold with the highest F1 (the lowest threshold in case of ties)."""
+    return max(curve, key=lambda m: (m['f'], -m['th']))
+
+
+def curve_to_str(curve):
+    out_str = "th\tprec\trec\tf\n"
+    for m in curve:
+        out_str += "\t".join([str(round(m['th'], 4)), str(round(m['prec'], 4)), str(round(m['rec'], 4)),
+                              str(round(m['f'], 4))]) + "\n"
+    return out_str
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-qrels", help="qrel file", type=str)
+    parser.add_argument("-run", help="result file", type=str)
+    parser.add_argument("-metric", help="evaluation metric", choices=METRICS, default="annot")
+    parser.add_argument("-th", help="thresholds (default: all scores of the run)", type=float, nargs="+")
+    parser.add_argument("-step", help="step of the threshold grid (instead of all scores of the run)", type=float)
+    parser.add_argument("-out", help="output file (tab-separated curve)", type=str)
+    args = parser.parse_args()
+
+    print "parsing qrel ..."
+    qrels, null_qrels = parse_file(args.qrels)  # here qrel does not contain null entities
+    print "parsing results ..."
+    results = parse_file(args.run, split_nulls=(args.metric == "topics"))[0]
+    print "evaluating ..."
+    sweep = ThresholdSweep(qrels, results, args.metric, null_qrels=null_qrels)
+    thresholds = args.th if args.th else sweep.thresholds(args.step)
+    curve = sweep.eval(thresholds)
+
+    out_str = curve_to_str(curve)
+    print "\n----------------\nEvaluation results (" + args.metric + "):\n" + out_str
+    best = best_threshold(curve)
+    print "Best threshold:", round(best['th'], 4), "(F1: " + str(round(best['f'], 4)) + ")"
+    if args.out:
+        open(args.out, "w").write(out_str)
+        print "Output file:", args.out
+
+
+if __name__ == '__main__':
+    main()